@@ -0,0 +1,210 @@
+import re
+import json
+import numpy as np
+
+from ptcgo import clean, normalize
+
+# Columns that describe a row rather than price it
+LABELS = {"Rarity", "Promo #", "SL#", "Set(s)", "Set(s) From", "Card Name"}
+# The pack table prices whole packs, everything is valued in Guardians Rising packs
+PACK_VALUE = "Regular Value"
+PLAIN = {"Card Price", "Card Prices", "Price", "Full Value", "HGSS", "COL"}
+# Tables without a Rarity column have a price column per printing
+PRINTINGS = {
+    "Regular Art": "Regular Art", "RA": "Regular Art", "Regular": "Regular Art",
+    "Full Art/SR": "Full Art", "FA": "Full Art",
+    "RR": "Rainbow Rare", "RR/SR": "Rainbow Rare", "SR": "Secret Rare",
+    "Foil": "Foil", "Foil/League": "Foil", "Shining": "Shining",
+}
+# Rough (cards of the rarity per pack, cards of the rarity in a set), so the chance of
+# pulling one given card is their ratio; rarities missing here don't count towards EV
+ODDS = {
+    "Common": (5, 40), "Uncommon": (3, 35), "Rare": (1, 35),
+    "Regular Art": (1 / 6, 12), "Full Art": (1 / 18, 12), "Rainbow Rare": (1 / 36, 8), "Secret Rare": (1 / 36, 8),
+    "Shining": (1 / 12, 15),
+}
+# "HS-Undaunted", "XY Base", "Double Crisis (7 card pack)", "ShiningLegends" and "Sun& Moon" all name their sets
+_SET_NOISE = re.compile(r"\(.*?\)|^hs-|\bbase( set)?$|[^a-z0-9]")
+
+
+_SET_ALIASES = {"bw": "blackwhite", "hgss": "heartgoldsoulsilver", "dragonvault": "dragonsvault"}
+
+
+def set_key(name):
+    key = _SET_NOISE.sub("", normalize(name))
+    return _SET_ALIASES.get(key, key)
+
+
+def number(value):
+    try:
+        return float(clean(value).split("/")[0])
+    except ValueError:
+        return None
+
+
+def rarity_of(column, fields):
+    if column in PRINTINGS:
+        return PRINTINGS[column]
+    if column in ("HGSS", "COL"):
+        return "Energy"
+    if column == "Full Value":
+        return "Legend"
+    if clean(fields.get("Rarity", "")):
+        return clean(fields["Rarity"])
+    if "Promo #" in fields:
+        return "Promo"
+    if "SL#" in fields:
+        return "Shiny Legend"
+    return "Unsorted"
+
+
+class PTCGOAnalytics:
+    """The PTCGO price sheet as typed columns, one entry per priced printing of a card.
+
+    Rows whose fields are all empty are set headers ("Guardians Rising 0"),
+    and the cards under a header belong to that set until the next header or
+    until a table with different columns starts. Per-set expected values and
+    per-rarity rankings are computed once with array operations when the
+    sheet loads, so queries are index lookups and slices."""
+
+    def __init__(self, cards, entries, packs):
+        self.names = [name for name, _ in cards]
+        self.card_sets = [set_name for _, set_name in cards]
+
+        # The first spelling of each set names it
+        spellings = {}
+        for name in self.card_sets:
+            if name:
+                spellings.setdefault(set_key(name), name)
+        self.sets = sorted(spellings.values())
+        self._set_keys = {set_key(name): i for i, name in enumerate(self.sets)}
+        self.rarities = sorted({rarity for _, rarity, _ in entries})
+        rarity_index = {rarity: i for i, rarity in enumerate(self.rarities)}
+
+        self.card = np.array([card for card, _, _ in entries], dtype=np.int32)
+        self.rarity = np.array([rarity_index[rarity] for _, rarity, _ in entries], dtype=np.int16)
+        self.price = np.array([price for _, _, price in entries], dtype=np.float64)
+        self.set = np.array([self._set_keys[set_key(self.card_sets[card])] if self.card_sets[card] else -1
+                             for card in self.card], dtype=np.int16)
+
+        self.packs = sorted(packs)
+        self.pack_values = np.array([packs[name] for name in self.packs], dtype=np.float64)
+        self._pack_keys = {set_key(name): i for i, name in enumerate(self.packs)}
+        self._rarity_keys = {normalize(name): i for i, name in enumerate(self.rarities)}
+
+        # Entries grouped by card name, for conversions
+        by_name = np.argsort(np.array([normalize(name) for name in self.names], dtype=object)[self.card], kind="stable")
+        keys = [normalize(self.names[self.card[i]]) for i in by_name]
+        self._names = {}
+        start = 0
+        for i in range(1, len(keys) + 1):
+            if i == len(keys) or keys[i] != keys[start]:
+                self._names[keys[start]] = by_name[start:i]
+                start = i
+
+        # Entries by rarity, most valuable first
+        self._order = np.lexsort((-self.price, self.rarity))
+        self._bounds = np.searchsorted(self.rarity[self._order], np.arange(len(self.rarities) + 1))
+
+        # Total price per (set, rarity) times the chance of pulling any one card of the rarity
+        in_set = self.set >= 0
+        cell = self.set[in_set].astype(np.int64) * len(self.rarities) + self.rarity[in_set]
+        size = len(self.sets) * len(self.rarities)
+        sums = np.bincount(cell, weights=self.price[in_set], minlength=size).reshape(len(self.sets), -1)
+        self.counts = np.bincount(cell, minlength=size).reshape(len(self.sets), -1)
+        chances = np.array([per_pack / pool for per_pack, pool in
+                            (ODDS.get(rarity, (0, 1)) for rarity in self.rarities)])
+        self.contributions = sums * chances
+        self.ev = self.contributions.sum(axis=1)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From (name, fields JSON) rows in sheet order, as PTCGOStore.rows gives them"""
+        cards, entries, packs = [], [], {}
+        current, columns = None, None
+        for name, fields in rows:
+            fields = json.loads(fields)
+            if not fields:
+                continue
+            values = {column: clean(value) for column, value in fields.items()}
+            if not any(values.values()):
+                current = name or None
+                columns = set(fields)
+                continue
+            if set(fields) != columns:
+                current, columns = None, set(fields)
+
+            if PACK_VALUE in fields:
+                value = number(fields[PACK_VALUE])
+                if name and value:
+                    packs[name] = value
+                continue
+
+            prices = []
+            for column, value in fields.items():
+                if column in LABELS or column == "Half Value":
+                    continue
+                price = number(value)
+                if price is not None and (column in PLAIN or column in PRINTINGS):
+                    prices.append((rarity_of(column, fields), price))
+            if not name or not prices:
+                continue
+
+            set_name = clean(fields.get("Set(s)") or fields.get("Set(s) From") or "") or current
+            cards.append((name, set_name))
+            entries.extend((len(cards) - 1, rarity, price) for rarity, price in prices)
+        return cls(cards, entries, packs)
+
+    def __len__(self):
+        return len(self.price)
+
+    def find_set(self, name):
+        return self._set_keys.get(set_key(name))
+
+    def find_rarity(self, name):
+        return self._rarity_keys.get(normalize(name))
+
+    def find_pack(self, name):
+        return self._pack_keys.get(set_key(name))
+
+    def top(self, rarity, limit=10, set_id=None):
+        """[(name, set, price)] of the most valuable entries of a rarity, optionally in one set"""
+        entries = self._order[self._bounds[rarity]:self._bounds[rarity + 1]]
+        if set_id is not None:
+            entries = entries[self.set[entries] == set_id]
+        return [(self.names[self.card[i]], self.card_sets[self.card[i]], float(self.price[i]))
+                for i in entries[:limit]]
+
+    def expected_value(self, set_id):
+        """EV of a pack of a set in Guardians Rising packs, and {rarity: (listed cards, EV share)}.
+
+        Cards the sheet doesn't list count as worthless, and the pull odds
+        are the rough ones in ODDS rather than the set's own."""
+        shares = {self.rarities[r]: (int(self.counts[set_id, r]), float(self.contributions[set_id, r]))
+                  for r in np.flatnonzero(self.counts[set_id])}
+        return float(self.ev[set_id]), shares
+
+    def ranking(self):
+        """[(set, EV, pack value or None)] best EV first, for sets with any EV"""
+        order = np.argsort(-self.ev)
+        ranked = []
+        for i in order[self.ev[order] > 0]:
+            pack = self.find_pack(self.sets[i])
+            ranked.append((self.sets[i], float(self.ev[i]), None if pack is None else float(self.pack_values[pack])))
+        return ranked
+
+    def conversions(self, name, pack_id=None):
+        """[(rarity, value in Guardians Rising packs, value in pack_id packs)] for every printing of a card or pack"""
+        pack = self.find_pack(name)
+        if pack is not None:
+            values = self.pack_values[[pack]]
+            rarities = ["Pack"]
+        else:
+            entries = self._names.get(normalize(name))
+            if entries is None:
+                return []
+            values = self.price[entries]
+            rarities = [self.rarities[r] for r in self.rarity[entries]]
+
+        converted = values / self.pack_values[pack_id] if pack_id is not None else np.full(len(values), np.nan)
+        return [(rarity, float(value), float(other)) for rarity, value, other in zip(rarities, values, converted)]
@@ -1,14 +1,100 @@
+import json
+import random
 import asyncio
 import aiohttp
-from urllib.parse import urlencode
+from dataclasses import dataclass
+from traceback import print_exc
+
+from cache import default_caches
+from batching import Batcher
+from httpclient import HTTPClient
+from credentials import Credentials
+from ratelimit import INTERACTIVE, BACKGROUND
+
+
+@dataclass(slots=True, frozen=True)
+class Category:
+    category_id: int
+    name: str
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['categoryId'], data['name'])
+
+
+@dataclass(slots=True, frozen=True)
+class Group:
+    group_id: int
+    category_id: int
+    name: str
+    abbreviation: str
+    modified_on: str
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['groupId'], data['categoryId'], data['name'],
+                   data.get('abbreviation') or "", data.get('modifiedOn') or "")
+
+
+@dataclass(slots=True, frozen=True)
+class ExtendedField:
+    name: str
+    display_name: str
+    value: str
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['name'], data['displayName'], data['value'])
+
+
+@dataclass(slots=True, frozen=True)
+class Product:
+    product_id: int
+    category_id: int
+    group_id: int
+    name: str
+    url: str
+    image_url: str
+    extended_data: tuple = ()
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['productId'], data['categoryId'], data['groupId'], data['name'],
+                   data.get('url') or "", data.get('imageUrl') or "",
+                   tuple(ExtendedField.from_json(item) for item in data.get('extendedData', ())))
+
+
+@dataclass(slots=True, frozen=True)
+class Price:
+    product_id: int
+    sub_type_name: str
+    low: float = None
+    mid: float = None
+    high: float = None
+    market: float = None
+    direct_low: float = None
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['productId'], data['subTypeName'], data.get('lowPrice'), data.get('midPrice'),
+                   data.get('highPrice'), data.get('marketPrice'), data.get('directLowPrice'))
 
 
 class TCGPlayerAPI:
-    BEARER_TOKEN: str = None
+    """Async TCGPlayer client, everything the bot asks TCGPlayer goes through here.
+
+    Products, prices and groups are cached per id, lookups from concurrent
+    callers are batched, and id lists are chunked to what the API accepts.
+    With a CatalogStore, products and groups are read from disk first. With a
+    ResponseStore, products and groups fetched from TCGPlayer are kept on
+    disk too; entries older than its max_age are still served, and refetched
+    in the background."""
+
     PUBLIC_KEY: str = None
     PRIVATE_KEY: str = None
 
     API_BASE: str = "https://api.tcgplayer.com/v1.37.0"
+    CHUNK_SIZE: int = 250
     manifests: dict = None
     categories: dict = None
     POKEMON_ID: int = None
@@ -16,63 +102,233 @@ class TCGPlayerAPI:
     YUGIOH_ID: int = None
     VANGUARD_ID: int = None
 
-    def __init__(self, public_key, private_key, token=None, loop=None, session=None):
-        if session is None:
-            if loop is None:
-                self._loop = asyncio.get_event_loop()
-            self._session = aiohttp.ClientSession(loop=loop)
-        else:
-            self._session = session
-
-        if token is not None:
-            self.BEARER_TOKEN = token
+    def __init__(self, public_key, private_key, token=None, session=None, http=None, caches=None, store=None,
+                 shared=None, responses=None):
+        if http is None:
+            http = HTTPClient(self.API_BASE, session=session)
+        self.http = http
 
         self.PUBLIC_KEY = public_key
         self.PRIVATE_KEY = private_key
+        self.credentials = Credentials(public_key, private_key, http, self, token=token, shared=shared)
+        self.caches = default_caches(shared) if caches is None else caches
+        self.store = store
+        self.responses = responses
+        self._revalidating = set()
+        self._listing_sizes = {}
+        self.revalidated = 0
+        self.changed = 0
+
+        self._prices = Batcher(self._fetch_prices, max_size=self.CHUNK_SIZE)
+        self._products = Batcher(self._fetch_products, max_size=self.CHUNK_SIZE)
+
+    @property
+    def BEARER_TOKEN(self):
+        return self.credentials.token
+
+    async def _update_manifests(self):
+        self.manifests = self.credentials.manifests
+        self.categories = self.credentials.categories
+        self.POKEMON_ID, self.MAGIC_ID, self.YUGIOH_ID, self.VANGUARD_ID = self.credentials.game_ids()
 
     async def refresh_token(self):
+        if self.credentials.load_snapshot():
+            await self._update_manifests()
+
+        await self.credentials.run(self._update_manifests)
+
+    async def close(self):
+        await self.http.close()
+
+    async def get_json(self, path, lane=INTERACTIVE, **params):
+        return await self.http.get_json(path, lane=lane, **params)
+
+    async def _results(self, path, lane=INTERACTIVE, **params):
+        try:
+            return (await self.get_json(path, lane=lane, **params))['results']
+        except aiohttp.ClientResponseError as e:
+            # Lookups where none of the ids exist come back as a 404
+            if e.status == 404:
+                return []
+            raise
+
+    async def _chunked(self, path, ids, lane=INTERACTIVE, **params):
+        ids = list(ids)
+        chunks = await asyncio.gather(*(
+            self._results(path + ",".join(str(x) for x in ids[i:i + self.CHUNK_SIZE]), lane=lane, **params)
+            for i in range(0, len(ids), self.CHUNK_SIZE)
+        ))
+        return [result for chunk in chunks for result in chunk]
+
+    async def paged(self, path, lane=INTERACTIVE, **params):
+        """Every result of a paginated listing, as raw JSON"""
+        results = []
         while True:
-            response = await self._session.get(
-                "https://api.tcgplayer.com/token",
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    # f"X-Tcg-Access-Token": "{self.ACCESS_TOKEN}"
-                },
-                data=urlencode({
-                    "grant_type": "client_credentials",
-                    "client_id": self.PUBLIC_KEY,
-                    "client_secret": self.PRIVATE_KEY
-                })
-            )
-            data = await response.json()
-            self.BEARER_TOKEN = data["access_token"]
-            assert data["userName"].lower() == self.PUBLIC_KEY.lower()
-
-            self.manifests = {}
-
-            response = await self._session.get(
-                f"{self.API_BASE}/catalog/categories",
-                headers={
-                    "Authorization": f"bearer {self.BEARER_TOKEN}",
-                    "Accept": "application/json"
-                },
-                params={"limit": 60}
-            )
-            rjson = await response.json()
-
-            self.categories = {v["name"]: v["categoryId"] for v in rjson["results"]}
-            self.POKEMON_ID = self.categories["Pokemon"]
-            self.MAGIC_ID = self.categories["Magic"]
-            self.YUGIOH_ID = self.categories["YuGiOh"]
-            self.VANGUARD_ID = self.categories["Cardfight Vanguard"]
-
-            for id in [self.POKEMON_ID, self.MAGIC_ID, self.YUGIOH_ID, self.VANGUARD_ID]:
-                response = await self._session.get(
-                    f"{self.API_BASE}/catalog/categories/{id}/search/manifest",
-                    headers={
-                        "Authorization": f"bearer {self.BEARER_TOKEN}"
-                    },
+            data = await self.get_json(path, lane=lane, offset=len(results), limit=100, **params)
+            results.extend(data['results'])
+            if not data['results'] or len(results) >= data['totalItems']:
+                return results
+
+    async def category_list(self, lane=INTERACTIVE):
+        return [Category.from_json(data) for data in await self._results("/catalog/categories", lane=lane, limit=100)]
+
+    async def manifest(self, category_id, lane=INTERACTIVE):
+        return await self.get_json(f"/catalog/categories/{category_id}/search/manifest", lane=lane)
+
+    async def search(self, category_id, query=None, sort="Relevance", filters=(), limit=100, lane=INTERACTIVE):
+        """productIds matching the query and filters, best first"""
+        filters = list(filters)
+        if query is not None:
+            filters.insert(0, {"name": "productName", "values": [query]})
+
+        async def fetch():
+            try:
+                resp = await self.http.json(
+                    "POST",
+                    f"/catalog/categories/{category_id}/search",
+                    lane=lane,
+                    data=json.dumps({"sort": sort, "filters": filters, "limit": limit})
                 )
-                self.manifests[id] = await response.json()
+            except aiohttp.ClientResponseError as e:
+                # TCGPlayer answers searches without results with a 404. Anything else (a 429 that
+                # outlasted its retries, a 401 before the token is set) raises, so it isn't cached
+                if e.status == 404:
+                    return []
+                raise
+            return resp['results']
+
+        key = (category_id, sort, limit, json.dumps(filters, sort_keys=True).lower())
+        return await self.caches["search"].get_or_fetch(key, fetch)
+
+    async def _stored(self, kind, ids, path, key, **params):
+        """Raw JSON for ids from the response store, or from TCGPlayer for whatever it doesn't have"""
+        found = {}
+        if self.responses is not None:
+            stale = {}
+            for x, (data, age) in self.responses.get_many(kind, ids).items():
+                found[x] = data
+                if age > self.responses.max_age:
+                    stale[x] = data
+            if stale:
+                self._revalidate(kind, stale, path, key, **params)
+            ids = [x for x in ids if x not in found]
+
+        if ids:
+            fetched = {data[key]: data for data in await self._chunked(path, ids, **params)}
+            if self.responses is not None:
+                self.responses.put_many(kind, fetched)
+            found.update(fetched)
+        return found
+
+    def _revalidate(self, kind, stale, path, key, **params):
+        """Refetch stale entries in the background, updating the caches for the ones that changed"""
+        stale = {x: data for x, data in stale.items() if (kind, x) not in self._revalidating}
+        if not stale:
+            return
+        self._revalidating.update((kind, x) for x in stale)
+
+        async def revalidate():
+            try:
+                fetched = {data[key]: data for data in
+                           await self._chunked(path, stale, lane=BACKGROUND, **params)}
+                self.responses.put_many(kind, fetched)
+                self.revalidated += len(fetched)
+
+                cache, parse = self.caches[kind], PARSERS[kind]
+                for x, data in fetched.items():
+                    if data != stale[x]:
+                        self.changed += 1
+                        cache.set(x, parse(data))
+            except Exception:
+                print_exc()
+            finally:
+                self._revalidating.difference_update((kind, x) for x in stale)
+
+        asyncio.ensure_future(revalidate())
+
+    async def _fetch_products(self, ids):
+        products = {}
+        if self.store is not None:
+            products = {x: Product.from_json(data) for x, data in self.store.products(ids).items()}
+            ids = [x for x in ids if x not in products]
+
+        if ids:
+            for x, data in (await self._stored("product", ids, "/catalog/products/", "productId",
+                                               getExtendedFields="true")).items():
+                products[x] = Product.from_json(data)
+        return products
+
+    async def _fetch_prices(self, ids, lane=INTERACTIVE):
+        prices = {x: [] for x in ids}
+        for data in await self._chunked("/pricing/product/", ids, lane=lane):
+            prices[data['productId']].append(Price.from_json(data))
+        return {x: tuple(rows) for x, rows in prices.items()}
+
+    async def _fetch_groups(self, ids):
+        groups = {}
+        if self.store is not None:
+            groups = {x: Group.from_json(data) for x, data in self.store.groups(ids).items()}
+            ids = [x for x in ids if x not in groups]
+
+        if ids:
+            for x, data in (await self._stored("group", ids, "/catalog/groups/", "groupId")).items():
+                groups[x] = Group.from_json(data)
+        return groups
+
+    async def products(self, ids):
+        """{productId: Product} with extended fields, for the ids that exist"""
+        return await self.caches["product"].get_many(ids, self._products.load_many)
+
+    async def prices(self, ids):
+        """{productId: (Price, ...)} with one Price per sub type"""
+        return await self.caches["price"].get_many(ids, self._prices.load_many)
+
+    async def sample_prices(self, ids):
+        """Current prices for many products at once on the background lane, refreshing the price cache"""
+        prices = await self._fetch_prices(ids, lane=BACKGROUND)
+        cache = self.caches["price"]
+        for x, rows in prices.items():
+            cache.set(x, rows)
+        return prices
+
+    async def groups(self, ids):
+        """{groupId: Group} for the ids that exist"""
+        return await self.caches["group"].get_many(ids, self._fetch_groups)
+
+    async def random_product(self, category_id, rng=random):
+        """A product drawn from a category's listing, for when the catalog isn't synced.
+
+        Costs one request once the listing's size is known."""
+        total = self._listing_sizes.get(category_id)
+        if total is None:
+            data = await self.get_json("/catalog/products", categoryId=category_id, limit=1)
+            total = self._listing_sizes[category_id] = data['totalItems']
+        if not total:
+            return None
+
+        data = await self.get_json("/catalog/products", categoryId=category_id, offset=rng.randrange(total), limit=1,
+                                   getExtendedFields="true")
+        if not data['results']:
+            # The listing shrank since its size was read
+            del self._listing_sizes[category_id]
+            return None
+        product = Product.from_json(data['results'][0])
+        self.caches["product"].set(product.product_id, product)
+        return product
+
+    async def product(self, product_id):
+        return (await self.products([product_id])).get(product_id)
+
+    async def group(self, group_id):
+        return (await self.groups([group_id])).get(group_id)
+
+    def batch_stats(self):
+        return {"price": self._prices.stats(), "product": self._products.stats()}
+
+    def response_stats(self):
+        stats = self.responses.stats() if self.responses is not None else {}
+        return {**stats, "revalidation": {"revalidated": self.revalidated, "changed": self.changed,
+                                          "in_flight": len(self._revalidating)}}
+
 
-            await asyncio.sleep(data["expires_in"])
+PARSERS = {"product": Product.from_json, "group": Group.from_json}
@@ -0,0 +1,72 @@
+import asyncio
+
+
+class Batcher:
+    """Merges id lookups from concurrent callers into shared bulk requests.
+
+    Ids asked for within `window` seconds of the first one are sent together
+    through `fetch`, an async function taking a list of ids and returning
+    {id: value}, in requests of at most `max_size` ids. Each caller only
+    gets back the ids it asked for."""
+
+    def __init__(self, fetch, window=0.025, max_size=250):
+        self.fetch = fetch
+        self.window = window
+        self.max_size = max_size
+
+        self._pending = {}
+        self._timer = None
+
+        self.lookups = 0
+        self.requests = 0
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "requests": self.requests,
+            "batch_size": self.lookups / self.requests if self.requests else 0.0,
+        }
+
+    async def load_many(self, ids):
+        loop = asyncio.get_event_loop()
+        futures = {}
+        for id in ids:
+            future = self._pending.get(id)
+            if future is None:
+                future = self._pending[id] = loop.create_future()
+                self.lookups += 1
+            futures[id] = future
+
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None and self._pending:
+            self._timer = loop.call_later(self.window, self.flush)
+
+        # Shielded so one caller giving up doesn't cancel the lookup for everyone else
+        values = await asyncio.gather(*(asyncio.shield(future) for future in futures.values()))
+        return {id: value for id, value in zip(futures, values) if value is not _NOT_FOUND}
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending = list(self._pending.items())
+        self._pending = {}
+        for i in range(0, len(pending), self.max_size):
+            asyncio.ensure_future(self._run(dict(pending[i:i + self.max_size])))
+
+    async def _run(self, batch):
+        self.requests += 1
+        try:
+            found = await self.fetch(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+                future.exception()
+        else:
+            for id, future in batch.items():
+                future.set_result(found.get(id, _NOT_FOUND))
+
+
+_NOT_FOUND = object()
@@ -0,0 +1,364 @@
+"""Benchmark the bot's commands offline against fake_tcgplayer.
+
+Runs c!search (first page, paging, bursts of clicks and every game at once),
+c!ptcgo and c!random for N concurrent simulated users through a fake discord Context and
+prints latency percentiles, throughput and the TCGPlayer requests and
+Discord calls each scenario made.
+
+    python bench.py --users 20 --iterations 10 --latency 0.05
+    python bench.py search random --catalog
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+from time import perf_counter
+from collections import Counter, defaultdict
+
+from fake_tcgplayer import FakeTCGPlayer, WORDS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NEXT, CLOSE = "▶", "❌"
+# Seconds to wait for the bot to react or edit before counting the run as an error
+WAIT_TIMEOUT = 10
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakeChannel:
+    def typing(self):
+        return FakeTyping()
+
+
+class FakeUser:
+    def __init__(self, id):
+        self.id = id
+        self.display_name = f"user{id}"
+
+
+class FakePayload:
+    """What on_raw_reaction_add gets"""
+    def __init__(self, message, user, emoji):
+        self.message_id = message.id
+        self.user_id = user.id
+        self.emoji = emoji
+
+
+class FakeMessage:
+    """A sent message, recording what the bot does to it"""
+    ids = iter(range(1, 1 << 62))
+    calls = Counter()
+
+    def __init__(self, delay, content=None, embed=None):
+        self.id = next(self.ids)
+        self.delay = delay
+        self.content = content
+        self.embed = embed
+        self.reactions = 0
+        self.edits = 0
+        self.changed = asyncio.Event()
+
+    async def _touch(self, counter):
+        # Counted once the call returns, so whoever waits on it knows the bot has moved on
+        await asyncio.sleep(self.delay)
+        setattr(self, counter, getattr(self, counter) + 1)
+        self.changed.set()
+
+    async def wait(self, predicate, timeout=WAIT_TIMEOUT):
+        """Wait until predicate() is true, raising TimeoutError if the bot never gets there"""
+        async def changed():
+            while not predicate():
+                self.changed.clear()
+                await self.changed.wait()
+
+        await asyncio.wait_for(changed(), timeout)
+
+    async def add_reaction(self, emoji):
+        self.calls["add_reaction"] += 1
+        await self._touch("reactions")
+
+    async def remove_reaction(self, emoji, member):
+        self.calls["remove_reaction"] += 1
+        await asyncio.sleep(self.delay)
+
+    async def edit(self, content=None, embed=None):
+        self.calls["edit"] += 1
+        self.embed = embed
+        await self._touch("edits")
+
+
+class FakeContext:
+    def __init__(self, bot, user, delay):
+        self.bot = bot
+        self.author = user
+        self.guild = None
+        self.channel = FakeChannel()
+        self.delay = delay
+        self.sent = []
+
+    async def send(self, content=None, *, embed=None):
+        FakeMessage.calls["send"] += 1
+        await asyncio.sleep(self.delay)
+        message = FakeMessage(self.delay, content, embed)
+        self.sent.append(message)
+        return message
+
+
+async def flip(bot, cog, ctx, user, pages):
+    """Press next on the command's paginator up to `pages` times, then close it"""
+    session = ctx.sent and cog.paginator.sessions.get(ctx.sent[0].id)
+    if not session:
+        return
+
+    message = session.message
+    await message.wait(lambda: message.reactions >= 3)
+    for _ in range(min(pages, session.total - 1)):
+        edits = message.edits
+        bot.dispatch("raw_reaction_add", FakePayload(message, user, NEXT))
+        await message.wait(lambda: message.edits > edits)
+
+    bot.dispatch("raw_reaction_add", FakePayload(message, user, CLOSE))
+    await session.closed.wait()
+
+
+async def search(bot, cog, ctx, user, rng, pages=0):
+    query = " ".join(rng.sample(WORDS, rng.choice((1, 1, 2)))).title()
+    await cog.search.callback(cog, ctx, query, rng.choice(list(cog.categories)[:3]))
+    await flip(bot, cog, ctx, user, pages)
+
+
+async def everywhere(bot, cog, ctx, user, rng):
+    """c!search without a game, so every game is searched"""
+    query = " ".join(rng.sample(WORDS, rng.choice((1, 1, 2)))).title()
+    await cog.search.callback(cog, ctx, query, None)
+    await flip(bot, cog, ctx, user, pages=3)
+
+
+async def burst(bot, cog, ctx, user, rng, clicks=5):
+    """Search, then press next `clicks` times without waiting for the page to change"""
+    query = " ".join(rng.sample(WORDS, rng.choice((1, 1, 2)))).title()
+    await cog.search.callback(cog, ctx, query, rng.choice(list(cog.categories)[:3]))
+    session = ctx.sent and cog.paginator.sessions.get(ctx.sent[0].id)
+    if not session:
+        return
+
+    message = session.message
+    await message.wait(lambda: message.reactions >= 3)
+    last = min(clicks, session.total - 1)
+    for _ in range(last):
+        bot.dispatch("raw_reaction_add", FakePayload(message, user, NEXT))
+    await message.wait(lambda: session.shown == last)
+    cog.paginator.close(session)
+
+
+async def paginate(bot, cog, ctx, user, rng):
+    await search(bot, cog, ctx, user, rng, pages=5)
+
+
+async def ptcgo(bot, cog, ctx, user, rng):
+    store = await cog.ptcgo_store()
+    await cog.ptcgo.callback(cog, ctx, name=rng.choice(store.names())[:8])
+    await flip(bot, cog, ctx, user, pages=3)
+
+
+async def random_card(bot, cog, ctx, user, rng):
+    await cog.random.callback(cog, ctx, rng.choice([None, *list(cog.categories)[:3]]))
+
+
+SCENARIOS = {"search": search, "paginate": paginate, "burst": burst, "everywhere": everywhere, "ptcgo": ptcgo,
+             "random": random_card}
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def cold_start(bot, launched, imported):
+    """Search until the bot answers with a result rather than asking to wait, as a user right after a restart would"""
+    cog = bot.cmdobj
+    user = FakeUser(0)
+    not_ready = errors = 0
+    while True:
+        ctx = FakeContext(bot, user, 0)
+        try:
+            await cog.search.callback(cog, ctx, "Pikachu", "Pokemon")
+        except Exception:
+            # An injected failure, the user would just try again
+            errors += 1
+            await asyncio.sleep(0.01)
+            continue
+        if ctx.sent[0].embed is not None or "starting up" not in ctx.sent[0].content:
+            break
+        not_ready += 1
+        await asyncio.sleep(0.01)
+
+    session = cog.paginator.sessions.get(ctx.sent[0].id)
+    if session is not None:
+        cog.paginator.close(session)
+    return {
+        "import_ms": (imported - launched) * 1000,
+        "first_response_ms": (perf_counter() - launched) * 1000,
+        "not_ready": not_ready,
+        "errors": errors,
+        **{f"{stage}_ms": t * 1000 for stage, t in bot.startup.items()},
+    }
+
+
+async def run_scenario(bot, fake, name, args):
+    cog = bot.cmdobj
+    for cache in bot.caches.values():
+        cache.invalidate()
+    bot.metrics.histograms.clear()
+    before = Counter(fake.requests)
+    embeds = bot.caches["embed"]
+    built, reused = embeds.misses, embeds.hits
+    calls = Counter(FakeMessage.calls)
+    latencies = []
+    errors = Counter()
+
+    async def user(n):
+        rng = random.Random(args.seed * 1000 + n)
+        member = FakeUser(n)
+        for _ in range(args.iterations):
+            ctx = FakeContext(bot, member, args.discord_latency)
+            start = perf_counter()
+            try:
+                await SCENARIOS[name](bot, cog, ctx, member, rng)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            else:
+                latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    await asyncio.gather(*(user(n) for n in range(args.users)))
+    elapsed = perf_counter() - start
+
+    requests = fake.requests - before
+    latencies.sort()
+    return {
+        "scenario": name,
+        "runs": len(latencies),
+        "errors": dict(errors),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "requests": sum(requests.values()),
+        "requests_per_run": sum(requests.values()) / max(1, len(latencies)),
+        "endpoints": dict(requests.most_common()),
+        "embeds": {"built": embeds.misses - built, "reused": embeds.hits - reused},
+        "discord": dict(FakeMessage.calls - calls),
+        "stages": {
+            " ".join(value for _, value in labels): histogram.snapshot()
+            for (metric, labels), histogram in sorted(bot.metrics.histograms.items()) if metric == "stage"
+        },
+    }
+
+
+def report(results):
+    print(f"{'scenario':<10} {'runs':>5} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'runs/s':>8} {'reqs':>6} {'reqs/run':>9}")
+    for r in results:
+        print(f"{r['scenario']:<10} {r['runs']:>5} {sum(r['errors'].values()):>4} {r['p50_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['throughput']:>8.1f} {r['requests']:>6} "
+              f"{r['requests_per_run']:>9.2f}")
+    for r in results:
+        print(f"\n{r['scenario']} requests:")
+        for endpoint, n in r["endpoints"].items():
+            print(f"  {n:>6}  {endpoint}")
+        for error, n in r["errors"].items():
+            print(f"  {n:>6}  error {error}")
+        if r["discord"]:
+            print("  discord " + ", ".join(f"{call} {n}" for call, n in sorted(r["discord"].items())))
+        if r["embeds"]["built"] or r["embeds"]["reused"]:
+            print(f"  embeds built {r['embeds']['built']}, reused {r['embeds']['reused']}")
+        for stage, stats in r["stages"].items():
+            print(f"  {stage:<12} p50 {stats['p50'] * 1000:>7.1f}ms  p95 {stats['p95'] * 1000:>7.1f}ms  "
+                  f"({stats['count']} samples)")
+
+
+async def load_catalog(bot, fake):
+    """Put the fake catalog on disk as a finished sync would have"""
+    store, products = bot.tcg.store, defaultdict(list)
+    for product in fake.products.values():
+        products[product["groupId"]].append(product)
+    for group in fake.groups.values():
+        store.replace_group(group["categoryId"], group, products[group["groupId"]])
+    for category_id in {group["categoryId"] for group in fake.groups.values()}:
+        store.mark_synced(category_id)
+    bot.cmdobj.catalog.synced = store.synced()
+    await bot.cmdobj.catalog.rebuild()
+
+
+async def main(args):
+    fake = FakeTCGPlayer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                         throttle_rate=args.throttle_rate, seed=args.seed)
+    token_url, api_base = await fake.start()
+
+    # The bot reads files.json and writes its databases in the working directory
+    workdir = tempfile.mkdtemp(prefix="cardbuddy-bench-")
+    shutil.copy(os.path.join(HERE, "files.json"), workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+
+    launched = perf_counter()
+    import main as cardbuddy
+    imported = perf_counter()
+    bot = cardbuddy.Bot(auth=["discord-token", fake.public_key, "private-key", "", ""])
+    bot.web.api_base = api_base
+    bot.credentials.TOKEN_URL = token_url
+    # Never logged in, but the paginator ignores the bot's own reactions by id
+    bot._connection.user = FakeUser(-1)
+    bot.web.scheduler.max_rate = bot.web.scheduler.rate = args.rate
+    bot.sync_catalog = False
+    if args.catalog:
+        await load_catalog(bot, fake)
+    try:
+        bot.warm()
+        startup = await cold_start(bot, launched, imported)
+        results = [await run_scenario(bot, fake, name, args) for name in args.scenarios]
+    finally:
+        await bot.web.close()
+        await fake.stop()
+        os.chdir(HERE)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"startup": startup, "scenarios": results}, indent=2))
+    else:
+        print("Cold start: import {import_ms:.0f}ms, first search answered after {first_response_ms:.0f}ms "
+              "({not_ready} not-ready replies, {errors} errors)\n".format(**startup))
+        report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=10, help="commands per user")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean fake TCGPlayer latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="seconds each fake discord call takes")
+    parser.add_argument("--rate", type=float, default=50.0, help="TCGPlayer requests per second the scheduler allows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--catalog", action="store_true",
+                        help="start with the catalog synced, so searches and c!random use the local copy")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+    asyncio.run(main(args))
@@ -0,0 +1,195 @@
+import time
+import asyncio
+from functools import partial
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a TTL.
+
+    Concurrent lookups of a key that is already being fetched wait on the
+    same in-flight fetch instead of starting their own. The fetch runs as a
+    task of its own, so a caller that is cancelled only stops waiting for
+    it, and the others still get its result. With a SharedStore,
+    misses are looked up there before being fetched, and fetched values are
+    written back for the other processes."""
+
+    def __init__(self, name, maxsize=1024, ttl=300, shared=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+
+        self._data = OrderedDict()
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def _lookup(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    async def get_or_fetch(self, key, fetch, ttl=None):
+        """Return the cached value for key, or await fetch() to produce it"""
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        task = self._in_flight(key)
+        if task is not None:
+            self.coalesced += 1
+            # A get_many that couldn't resolve the key leaves it for this call to fetch
+            value = (await asyncio.shield(task)).get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        self.misses += 1
+        task = self._start([key], lambda keys: self._fetch_one(key, fetch), ttl)
+        return (await asyncio.shield(task))[key]
+
+    def _in_flight(self, key):
+        task = self._pending.get(key)
+        # One that failed is retried rather than handed out again
+        return None if task is None or task.done() else task
+
+    def _start(self, keys, fetch, ttl):
+        """A task fetching keys that every caller wanting them awaits"""
+        task = asyncio.ensure_future(self._fetch_many(keys, fetch, ttl))
+        for key in keys:
+            self._pending[key] = task
+        task.add_done_callback(partial(self._fetched, keys))
+        return task
+
+    def _fetched(self, keys, task):
+        for key in keys:
+            if self._pending.get(key) is task:
+                del self._pending[key]
+        if not task.cancelled():
+            task.exception()  # Don't warn about it if nobody was waiting any more
+
+    @staticmethod
+    async def _fetch_one(key, fetch):
+        return {key: await fetch()}
+
+    async def _fetch_many(self, keys, fetch, ttl=None):
+        """Values for keys from the shared store or else fetch, cached here either way"""
+        found = {}
+        if self.shared is not None:
+            for key, (value, left) in self.shared.get_many(self.name, keys).items():
+                self.set(key, value, left)
+                found[key] = value
+            keys = [key for key in keys if key not in found]
+
+        if keys:
+            fetched = await fetch(keys)
+            for key, value in fetched.items():
+                self.set(key, value, ttl)
+            if self.shared is not None:
+                self.shared.set_many(self.name, fetched, self.ttl if ttl is None else ttl)
+            found.update(fetched)
+        return found
+
+    async def get_many(self, keys, fetch, ttl=None):
+        """Return {key: value} for every key that fetch could resolve.
+
+        fetch is called at most once, with only the keys that are neither
+        cached nor already being fetched, and must return a dict."""
+        found = {}
+        waiting = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                found[key] = value
+            elif self._in_flight(key) is not None:
+                self.coalesced += 1
+                waiting[key] = self._in_flight(key)
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if missing:
+            fetched = await asyncio.shield(self._start(missing, fetch, ttl))
+            found.update((key, fetched[key]) for key in missing if key in fetched)
+
+        for key, task in waiting.items():
+            try:
+                value = (await asyncio.shield(task)).get(key, _MISSING)
+            except Exception:
+                continue
+            if value is not _MISSING:
+                found[key] = value
+
+        return found
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+class _Missing:
+    def __repr__(self):
+        return "<MISSING>"
+
+
+_MISSING = _Missing()
+
+
+def default_caches(shared=None):
+    """The caches shared by the bot's TCGPlayer lookups.
+
+    Group metadata and product details barely change, prices move constantly.
+    Rendered embeds are keyed on their prices and stay local to the process."""
+    return {
+        "search": TTLCache("search", maxsize=2048, ttl=15 * 60, shared=shared),
+        "group": TTLCache("group", maxsize=4096, ttl=24 * 60 * 60, shared=shared),
+        "product": TTLCache("product", maxsize=16384, ttl=6 * 60 * 60, shared=shared),
+        "price": TTLCache("price", maxsize=16384, ttl=5 * 60, shared=shared),
+        "embed": TTLCache("embed", maxsize=4096, ttl=60 * 60),
+    }
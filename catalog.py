@@ -0,0 +1,364 @@
+import re
+import json
+import math
+import random
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from traceback import print_exc
+
+from store import connect, select_in
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    groupId INTEGER PRIMARY KEY,
+    categoryId INTEGER NOT NULL,
+    modifiedOn TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    productId INTEGER PRIMARY KEY,
+    categoryId INTEGER NOT NULL,
+    groupId INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_group ON products (groupId);
+CREATE TABLE IF NOT EXISTS synced (
+    categoryId INTEGER PRIMARY KEY
+);
+"""
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(name):
+    """Lowercase a name and reduce it to single-space separated alphanumeric words"""
+    return " ".join(_WORD.findall(name.lower()))
+
+
+def trigrams(name):
+    padded = f" {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogStore:
+    """On-disk copy of the TCGPlayer catalog for the categories we sync"""
+
+    def __init__(self, path="catalog.db"):
+        self.path = path
+        self.db = connect(path, SCHEMA, synchronous="FULL")
+
+    def reader(self):
+        """Another connection to the same database, for reading it in an executor thread"""
+        return CatalogStore(self.path)
+
+    def version(self):
+        """Changes whenever another connection commits to the database"""
+        return self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    def group_dates(self, category_id):
+        return dict(self.db.execute("SELECT groupId, modifiedOn FROM groups WHERE categoryId = ?", (category_id,)))
+
+    def synced(self):
+        """Categories that have been through at least one complete sync"""
+        return {row[0] for row in self.db.execute("SELECT categoryId FROM synced")}
+
+    def mark_synced(self, category_id):
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO synced VALUES (?)", (category_id,))
+
+    def replace_group(self, category_id, group, products):
+        with self.db:
+            self.db.execute("DELETE FROM products WHERE groupId = ?", (group['groupId'],))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)",
+                ((p['productId'], category_id, group['groupId'], p['name'], json.dumps(p)) for p in products)
+            )
+            self.db.execute("INSERT OR REPLACE INTO groups VALUES (?, ?, ?, ?)",
+                            (group['groupId'], category_id, group['modifiedOn'], json.dumps(group)))
+
+    def remove_groups(self, group_ids):
+        with self.db:
+            for group_id in group_ids:
+                self.db.execute("DELETE FROM products WHERE groupId = ?", (group_id,))
+                self.db.execute("DELETE FROM groups WHERE groupId = ?", (group_id,))
+
+    def _load(self, table, column, ids):
+        rows = select_in(self.db, f"SELECT {column}, data FROM {table} WHERE {column} IN ({{ids}})", ids)
+        return {key: json.loads(data) for key, data in rows}
+
+    def products(self, ids):
+        """Get {productId: product} for the stored products among ids"""
+        return self._load("products", "productId", ids)
+
+    def groups(self, ids):
+        """Get {groupId: group} for the stored groups among ids"""
+        return self._load("groups", "groupId", ids)
+
+    def names(self):
+        return self.db.execute("SELECT productId, categoryId, name FROM products")
+
+    def product_ids(self):
+        return self.db.execute("SELECT categoryId, groupId, productId FROM products ORDER BY groupId")
+
+
+class NameIndex:
+    """In-memory product name index supporting exact, prefix and typo-tolerant lookups.
+
+    Names are normalized and deduplicated, each distinct name owning a run of
+    (productId, categoryId) pairs in flat arrays, and fuzzy lookups go through
+    a trigram -> name postings map."""
+
+    MIN_SIMILARITY = 0.5
+
+    def __init__(self, rows):
+        by_name = defaultdict(list)
+        for product_id, category_id, name in rows:
+            by_name[normalize(name)].append((product_id, category_id))
+
+        self.names = sorted(by_name)
+        self.offsets = array('I', [0])
+        self.product_ids = array('I')
+        self.category_ids = array('H')
+        postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            for product_id, category_id in by_name[name]:
+                self.product_ids.append(product_id)
+                self.category_ids.append(category_id)
+            self.offsets.append(len(self.product_ids))
+            for gram in trigrams(name):
+                postings[gram].append(i)
+
+        self.postings = {gram: array('I', names) for gram, names in postings.items()}
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def _expand(self, name_ids, category, limit):
+        found = []
+        for i in name_ids:
+            for j in range(self.offsets[i], self.offsets[i + 1]):
+                if category is None or self.category_ids[j] == category:
+                    found.append(self.product_ids[j])
+                    if len(found) >= limit:
+                        return found
+        return found
+
+    def _exact(self, query):
+        i = bisect_left(self.names, query)
+        if i < len(self.names) and self.names[i] == query:
+            return [i]
+        return []
+
+    def _prefix(self, query, cap=1000):
+        start = bisect_left(self.names, query)
+        end = start
+        while end < len(self.names) and end - start < cap and self.names[end].startswith(query):
+            end += 1
+        return sorted(range(start, end), key=lambda i: len(self.names[i]))
+
+    def _fuzzy(self, query, cap=1000):
+        grams = trigrams(query)
+        needed = max(1, math.ceil(len(grams) * self.MIN_SIMILARITY))
+
+        # Counting postings is done in C by Counter.update, which beats
+        # recomputing the trigrams of every candidate name by a wide margin
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scored = sorted((-count, len(self.names[i]), i) for i, count in shared.items() if count >= needed)
+        return [i for _, _, i in scored[:cap]]
+
+    def exact(self, query, category=None, limit=100):
+        return self._expand(self._exact(normalize(query)), category, limit)
+
+    def prefix(self, query, category=None, limit=100):
+        return self._expand(self._prefix(normalize(query)), category, limit)
+
+    def fuzzy(self, query, category=None, limit=100):
+        return self._expand(self._fuzzy(normalize(query)), category, limit)
+
+    def search(self, query, category=None, limit=100):
+        """Exact matches first, then prefix matches, then the closest misspellings"""
+        query = normalize(query)
+        if not query:
+            return []
+
+        ranked = dict.fromkeys(self._exact(query))
+        ranked.update(dict.fromkeys(self._prefix(query)))
+        if len(ranked) < limit:
+            ranked.update(dict.fromkeys(self._fuzzy(query)))
+        return self._expand(ranked, category, limit)
+
+
+class ProductIds:
+    """Every stored productId in a packed array per group, for drawing products at random.
+
+    A group's array is replaced whenever the group syncs, and a category's
+    prefix sums of group sizes are rebuilt on the first draw after one of
+    its groups changed, so draws stay uniform over products in O(log groups)."""
+
+    def __init__(self):
+        self.groups = defaultdict(dict)
+        self._sums = {}
+
+    @classmethod
+    def load(cls, rows):
+        """From (categoryId, groupId, productId) rows ordered by group"""
+        self = cls()
+        for category_id, group_id, product_id in rows:
+            ids = self.groups[category_id].get(group_id)
+            if ids is None:
+                ids = self.groups[category_id][group_id] = array('I')
+            ids.append(product_id)
+        return self
+
+    def __len__(self):
+        return sum(self.count(category_id) for category_id in self.groups)
+
+    def count(self, category_id):
+        sums = self._prefix(category_id)
+        return sums[1][-1] if sums[1] else 0
+
+    def replace(self, category_id, group_id, product_ids):
+        self.groups[category_id][group_id] = array('I', product_ids)
+        self._sums.pop(category_id, None)
+
+    def remove(self, category_id, group_ids):
+        for group_id in group_ids:
+            self.groups[category_id].pop(group_id, None)
+        self._sums.pop(category_id, None)
+
+    def _prefix(self, category_id):
+        sums = self._sums.get(category_id)
+        if sums is None:
+            order = [ids for ids in self.groups.get(category_id, {}).values() if ids]
+            totals, total = array('Q'), 0
+            for ids in order:
+                total += len(ids)
+                totals.append(total)
+            sums = self._sums[category_id] = (order, totals)
+        return sums
+
+    def random(self, category_id=None, rng=random):
+        """A uniformly drawn productId from one category or all of them, None when there are none"""
+        categories = list(self.groups) if category_id is None else [category_id]
+        counts = [self.count(x) for x in categories]
+        if not sum(counts):
+            return None
+
+        n = rng.randrange(sum(counts))
+        for category_id, count in zip(categories, counts):
+            if n < count:
+                break
+            n -= count
+        order, totals = self._prefix(category_id)
+        i = bisect_right(totals, n)
+        return order[i][n - (totals[i - 1] if i else 0)]
+
+
+class CatalogSync:
+    """Mirrors the catalog of some categories into a CatalogStore and indexes it.
+
+    Each pass only downloads the products of groups whose modifiedOn changed
+    since the last pass, so a restart resumes from what is already on disk.
+    When several processes share the store, claim(interval) decides which
+    one runs a pass; the others rebuild their index when the store changes.
+    The productIds for `random` are kept up to date group by group."""
+
+    POLL = 5 * 60
+
+    def __init__(self, store, paged, interval=12 * 60 * 60, claim=None):
+        self.store = store
+        self.paged = paged
+        self.interval = interval
+        self.claim = claim
+        self.index = None
+        self.suggestions = {}
+        self.ids = ProductIds()
+        self.synced = set()
+
+    def searchable(self, category_id):
+        return self.index is not None and category_id in self.synced
+
+    async def sync_category(self, category_id):
+        """Bring one category up to date, returning how many groups changed"""
+        groups = await self.paged(f"/catalog/categories/{category_id}/groups")
+        known = self.store.group_dates(category_id)
+        changed = 0
+        for group in groups:
+            if known.pop(group['groupId'], None) == group['modifiedOn']:
+                continue
+            products = await self.paged("/catalog/products", categoryId=category_id,
+                                        groupId=group['groupId'], getExtendedFields="true")
+            self.store.replace_group(category_id, group, products)
+            self.ids.replace(category_id, group['groupId'], [p['productId'] for p in products])
+            changed += 1
+
+        if known:
+            self.store.remove_groups(known)
+            self.ids.remove(category_id, known)
+        self.store.mark_synced(category_id)
+        return changed + len(known)
+
+    async def rebuild(self, ids=True):
+        """Rebuild the name index and suggestions, and reload the productIds unless they were updated as groups synced"""
+        from suggest import Suggester
+
+        def build():
+            # Reading a few hundred thousand rows takes long enough that it can't happen on the event loop
+            store = self.store.reader()
+            try:
+                rows = store.names().fetchall()
+                product_ids = ProductIds.load(store.product_ids()) if ids else None
+                return NameIndex(rows), Suggester.by_category(rows), product_ids
+            finally:
+                store.db.close()
+
+        index, suggestions, product_ids = await asyncio.get_event_loop().run_in_executor(None, build)
+        self.index, self.suggestions = index, suggestions
+        if product_ids is not None:
+            self.ids = product_ids
+
+    async def run(self, category_ids):
+        self.synced = self.store.synced()
+        if self.synced:
+            # Serve what is already on disk while this pass catches up
+            await self.rebuild()
+
+        if self.claim is not None:
+            return await self.follow(category_ids)
+
+        while True:
+            await self.sync(category_ids)
+            await asyncio.sleep(self.interval)
+
+    async def sync(self, category_ids):
+        changed = 0
+        for category_id in category_ids:
+            try:
+                changed += await self.sync_category(category_id)
+            except Exception:
+                print_exc()
+            else:
+                self.synced.add(category_id)
+
+        if changed or self.index is None:
+            await self.rebuild(ids=self.index is None)
+
+    async def follow(self, category_ids):
+        """Sync when this process claims the pass, otherwise pick up what another process synced"""
+        version = self.store.version()
+        while True:
+            if self.claim(self.interval):
+                await self.sync(category_ids)
+                version = self.store.version()
+            elif self.store.version() != version:
+                version = self.store.version()
+                self.synced = self.store.synced()
+                await self.rebuild()
+
+            await asyncio.sleep(self.POLL)
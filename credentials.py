@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import random
+import asyncio
+import aiohttp
+from traceback import print_exc
+from urllib.parse import urlencode
+
+from ratelimit import BACKGROUND
+
+
+class Credentials:
+    """The TCGPlayer bearer token and the category manifests that go with it.
+
+    Concurrent refreshes share one in-flight request, the token is renewed
+    `margin` seconds before it expires, and the manifests are kept on disk so
+    a restart can serve them before the first token is even fetched. With a
+    SharedStore, one process fetches the token and manifests for all of them.
+    The categories and manifests come through client, the TCGPlayerAPI."""
+
+    TOKEN_URL = "https://api.tcgplayer.com/token"
+    GAMES = ("Pokemon", "Magic", "YuGiOh", "Cardfight Vanguard")
+
+    RETRIES = 6
+    BACKOFF = 1
+    MAX_BACKOFF = 60
+    MANIFEST_TTL = 6 * 60 * 60
+
+    def __init__(self, public_key, private_key, http, client, token=None, snapshot="manifests.json", margin=300,
+                 shared=None):
+        self.public_key = public_key
+        self.private_key = private_key
+        self.http = http
+        self.client = client
+        self.snapshot = snapshot
+        self.margin = margin
+        self.shared = shared
+
+        self.token = token
+        self.expires = 0
+        self.categories = None
+        self.manifests = {}
+        self.manifests_fetched = 0
+        self._refresh = None
+        if token is not None:
+            http.set_token(token)
+        http.authorize = self.authorized
+
+    @property
+    def fresh(self):
+        return self.token is not None and time.time() < self.expires - self.margin
+
+    @property
+    def manifests_due(self):
+        return self.manifests_fetched + self.MANIFEST_TTL
+
+    async def get_token(self):
+        if not self.fresh:
+            await self.refresh()
+        return self.token
+
+    async def authorized(self):
+        """Wait for the first token. Manifests restored from a snapshot let commands start before
+        there is one, and TCGPlayer refuses whatever they send without it"""
+        if self.token is None:
+            await self.get_token()
+
+    async def refresh(self):
+        """Fetch a new token, or wait for the fetch that is already happening"""
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._fetch_token())
+            self._refresh.add_done_callback(self._refreshed)
+        return await asyncio.shield(self._refresh)
+
+    def _refreshed(self, future):
+        self._refresh = None
+        if not future.cancelled():
+            future.exception()
+
+    async def _retry(self, func, *args, **kwargs):
+        """Call func until it succeeds, with full-jitter exponential backoff between tries"""
+        for attempt in range(self.RETRIES):
+            try:
+                return await func(*args, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                if attempt == self.RETRIES - 1:
+                    raise
+                await asyncio.sleep(random.uniform(0, min(self.MAX_BACKOFF, self.BACKOFF * 2 ** attempt)))
+
+    async def _request_token(self):
+        async with self.http.request(
+            "POST",
+            self.TOKEN_URL,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data=urlencode({
+                "grant_type": "client_credentials",
+                "client_id": self.public_key,
+                "client_secret": self.private_key
+            })
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    def _set_token(self, token, expires):
+        self.token = token
+        self.expires = expires
+        self.http.set_token(token)
+
+    async def _from_shared(self, key, fresh=lambda value: True):
+        """The shared value for key, or None once this process has claimed fetching it itself"""
+        # Whoever claims the refresh does the fetching, everyone else picks it up from the store
+        while True:
+            value = self.shared.get("credentials", key)
+            if value is not None and fresh(value):
+                return value
+            if self.shared.claim(f"{key} refresh", 60):
+                return None
+            await asyncio.sleep(1)
+
+    async def _fetch_token(self):
+        if self.shared is not None:
+            shared = await self._from_shared("token", lambda value: time.time() < value[1] - self.margin)
+            if shared is not None:
+                self._set_token(*shared)
+                return self.token
+
+        try:
+            data = await self._retry(self._request_token)
+            assert data["userName"].lower() == self.public_key.lower()
+            self._set_token(data["access_token"].strip(), time.time() + data["expires_in"])
+            if self.shared is not None:
+                self.shared.set("credentials", "token", (self.token, self.expires), data["expires_in"])
+        finally:
+            if self.shared is not None:
+                self.shared.release("token refresh")
+        return self.token
+
+    def game_ids(self):
+        return [self.categories[name] for name in self.GAMES]
+
+    async def load_manifests(self):
+        """Fetch the category list, then every game's search manifest at once"""
+        if self.shared is not None:
+            shared = await self._from_shared("manifests")
+            if shared is not None:
+                self.categories, self.manifests, self.manifests_fetched = shared
+                return
+
+        try:
+            categories = await self._retry(self.client.category_list, lane=BACKGROUND)
+            self.categories = {category.name: category.category_id for category in categories}
+
+            ids = self.game_ids()
+            manifests = await asyncio.gather(*(self._retry(self.client.manifest, id, lane=BACKGROUND) for id in ids))
+            self.manifests = dict(zip(ids, manifests))
+            self.manifests_fetched = time.time()
+            self.save_snapshot()
+            if self.shared is not None:
+                self.shared.set("credentials", "manifests", (self.categories, self.manifests, self.manifests_fetched),
+                                self.MANIFEST_TTL)
+        finally:
+            if self.shared is not None:
+                self.shared.release("manifests refresh")
+
+    def save_snapshot(self):
+        tmp = self.snapshot + ".tmp"
+        with open(tmp, 'w') as fd:
+            json.dump({"categories": self.categories, "manifests": self.manifests,
+                       "fetched": self.manifests_fetched}, fd)
+        os.replace(tmp, self.snapshot)
+
+    def load_snapshot(self):
+        """Restore the manifests saved by the last run, returning whether there were any"""
+        try:
+            with open(self.snapshot) as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return False
+
+        self.categories = data["categories"]
+        self.manifests = {int(id): manifest for id, manifest in data["manifests"].items()}
+        self.manifests_fetched = data.get("fetched", 0)
+        return True
+
+    async def run(self, callback=None):
+        """Keep the token and manifests fresh forever, awaiting callback after each refresh.
+
+        Manifests restored from a snapshot younger than MANIFEST_TTL aren't refetched."""
+        while True:
+            try:
+                await self.get_token()
+                if time.time() >= self.manifests_due:
+                    await self.load_manifests()
+                if callback is not None:
+                    await callback()
+            except Exception:
+                print_exc()
+                await asyncio.sleep(self.MAX_BACKOFF)
+                continue
+
+            await asyncio.sleep(max(0, min(self.expires - self.margin, self.manifests_due) - time.time()))
@@ -0,0 +1,202 @@
+import re
+import csv
+import asyncio
+from dataclasses import dataclass
+
+from catalog import normalize
+
+# "4 Lightning Bolt", "4x Lightning Bolt", "* 4 Pikachu V SSH 43"
+COUNTED = re.compile(r"^(?:\*\s*)?(\d+)\s*x?\s+(.+)$", re.I)
+# MTG Arena: "Lightning Bolt (M10) 146"
+ARENA = re.compile(r"^(.+?)\s+\(([A-Za-z0-9]+)\)(?:\s+\S+)?$")
+# PTCGO: "Pikachu V SSH 43", "Zeraora GX PR-SM 167"
+PTCGO = re.compile(r"^(.+?)\s+([A-Z][A-Z0-9]{1,5}(?:-[A-Z0-9]{1,4})?)\s+\d+[a-z]?$")
+# Section lines of the Arena and PTCGO exports, e.g. "Sideboard", "##Pokémon - 12", "Total Cards: 60"
+HEADER = re.compile(r"^(?:#.*|(?:deck|sideboard|commander|companion|maybeboard)\s*:?|"
+                    r"(?:pok[eé]mon|trainer|trainer cards|energy|total cards)\s*[-:]?\s*\d*)$", re.I)
+
+NAME_COLUMNS = ("name", "card name", "card", "product name")
+QUANTITY_COLUMNS = ("quantity", "qty", "count", "amount")
+SET_COLUMNS = ("set", "set code", "edition", "set name")
+
+
+@dataclass(slots=True, frozen=True)
+class Entry:
+    quantity: int
+    name: str
+    set_code: str = None
+
+
+@dataclass(slots=True, frozen=True)
+class Line:
+    """An entry with the product it resolved to, and that product's cheapest market price"""
+    entry: Entry
+    product_id: int = None
+    sub_type: str = None
+    price: float = None
+
+    @property
+    def total(self):
+        return 0.0 if self.price is None else self.price * self.entry.quantity
+
+
+class DecklistParser:
+    """Turns lines of a decklist into Entries one at a time, so input can be parsed as it arrives.
+
+    Understands "4 Name" / "4x Name" lines with an optional Arena "(SET) 123"
+    or PTCGO "SET 123" suffix, and CSV files with a header row naming a card
+    name column. Section headers are skipped, other lines are counted as bad."""
+
+    def __init__(self):
+        self.first = True
+        self.columns = None
+        self.bad = 0
+
+    def feed(self, line):
+        """The Entry on line, or None"""
+        line = line.strip().lstrip("\ufeff")
+        if not line or HEADER.match(line):
+            return None
+
+        if self.first:
+            self.first = False
+            if "," in line or "\t" in line:
+                header = [cell.strip().lower() for cell in next(csv.reader([line], self._dialect(line)))]
+                if any(name in header for name in NAME_COLUMNS):
+                    self.columns = header
+                    return None
+
+        if self.columns is not None:
+            return self._row(next(csv.reader([line], self._dialect(line))))
+
+        match = COUNTED.match(line)
+        if match is None:
+            self.bad += 1
+            return None
+        quantity, name = int(match.group(1)), match.group(2).strip()
+        set_code = None
+        match = ARENA.match(name) or PTCGO.match(name)
+        if match is not None:
+            name, set_code = match.group(1), match.group(2)
+        return Entry(quantity, name, set_code) if quantity > 0 else None
+
+    @staticmethod
+    def _dialect(line):
+        return "excel-tab" if "\t" in line and "," not in line else "excel"
+
+    def _row(self, cells):
+        row = {column: cell.strip() for column, cell in zip(self.columns, cells)}
+        name = next((row[column] for column in NAME_COLUMNS if row.get(column)), None)
+        if name is None:
+            self.bad += 1
+            return None
+        quantity = next((row[column] for column in QUANTITY_COLUMNS if row.get(column)), "1")
+        set_code = next((row[column] for column in SET_COLUMNS if row.get(column)), None)
+        try:
+            quantity = int(float(quantity))
+        except ValueError:
+            self.bad += 1
+            return None
+        return Entry(quantity, name, set_code) if quantity > 0 else None
+
+
+class Deck:
+    """Entries added up by card, holding at most max_cards different ones"""
+
+    def __init__(self, max_cards=2000):
+        self.max_cards = max_cards
+        self.cards = {}
+        self.lines = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.cards)
+
+    def add(self, entry):
+        self.lines += 1
+        if entry is None:
+            return
+        key = (normalize(entry.name), (entry.set_code or "").lower())
+        known = self.cards.get(key)
+        if known is not None:
+            self.cards[key] = Entry(known.quantity + entry.quantity, known.name, known.set_code)
+        elif len(self.cards) < self.max_cards:
+            self.cards[key] = entry
+        else:
+            self.dropped += 1
+
+    def entries(self):
+        return list(self.cards.values())
+
+
+class Valuer:
+    """Prices a list of Entries in one category.
+
+    Names are resolved against the local catalog index when the category is
+    synced, otherwise the first MAX_SEARCHES through TCGPlayer's search. All
+    the candidates are priced together in calls of CHUNK_SIZE ids,
+    `concurrency` at a time. Entries with a set code go to the printing from
+    that set, the rest to the cheapest printing."""
+
+    CANDIDATES = 8
+    MAX_SEARCHES = 50
+
+    def __init__(self, tcg, catalog, concurrency=4):
+        self.tcg = tcg
+        self.catalog = catalog
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def _limited(self, coroutine):
+        async with self.semaphore:
+            return await coroutine
+
+    async def candidates(self, category_id, names):
+        """{name: [productId, ...]} with the likeliest products first"""
+        if self.catalog.searchable(category_id):
+            index = self.catalog.index
+            return {name: index.exact(name, category_id, self.CANDIDATES) or index.search(name, category_id, 1)
+                    for name in names}
+
+        searched = names[:self.MAX_SEARCHES]
+        found = await asyncio.gather(*(self._limited(self.tcg.search(category_id, name, limit=self.CANDIDATES))
+                                       for name in searched))
+        return {name: [] for name in names} | dict(zip(searched, found))
+
+    async def prices(self, ids):
+        ids = list(ids)
+        size = self.tcg.CHUNK_SIZE
+        prices = {}
+        for chunk in await asyncio.gather(*(self._limited(self.tcg.prices(ids[i:i + size]))
+                                            for i in range(0, len(ids), size))):
+            prices.update(chunk)
+        return prices
+
+    async def sets(self, ids):
+        """{productId: set abbreviation, lowercased}"""
+        products = await self.tcg.products(ids)
+        groups = await self.tcg.groups({product.group_id for product in products.values()})
+        return {product_id: groups[product.group_id].abbreviation.lower() for product_id, product in products.items()
+                if product.group_id in groups}
+
+    async def value(self, category_id, entries):
+        """A Line per entry, in the same order"""
+        candidates = await self.candidates(category_id, list({entry.name for entry in entries}))
+        prices = await self.prices({x for ids in candidates.values() for x in ids})
+        sets = await self.sets({x for entry in entries if entry.set_code and len(candidates[entry.name]) > 1
+                                for x in candidates[entry.name]})
+
+        lines = []
+        for entry in entries:
+            ids = candidates[entry.name]
+            if entry.set_code:
+                ids = [x for x in ids if sets.get(x) == entry.set_code.lower()] or ids
+
+            best = None
+            for product_id in ids:
+                for price in prices.get(product_id, ()):
+                    if price.market is not None and (best is None or price.market < best.price):
+                        best = Line(entry, product_id, price.sub_type_name, price.market)
+            if best is None:
+                best = Line(entry, ids[0] if ids else None)
+            lines.append(best)
+        return lines
@@ -0,0 +1,45 @@
+import discord
+from time import perf_counter
+from collections import defaultdict
+
+
+class DiscordIO:
+    """Per-route usage of the bot's Discord REST calls.
+
+    Wraps discord.py's HTTPClient.request, which every REST call goes
+    through, so sends, edits and reactions from anywhere are counted by
+    route ("PATCH /channels/{channel_id}/messages/{message_id}"). A call that
+    finds its rate limit bucket's lock held is counted as queued: it waits
+    on an earlier call to the same bucket, or on the bucket refilling."""
+
+    def __init__(self, http, metrics=None):
+        self.http = http
+        self.metrics = metrics
+        self.routes = defaultdict(lambda: {"calls": 0, "queued": 0, "in_flight": 0, "errors": 0})
+        self._request = http.request
+        http.request = self.request
+
+    async def request(self, route, **kwargs):
+        name = f"{route.method} {route.path}"
+        stats = self.routes[name]
+        stats["calls"] += 1
+        lock = getattr(self.http, "_locks", {}).get(route.bucket)
+        if lock is not None and lock.locked():
+            stats["queued"] += 1
+
+        stats["in_flight"] += 1
+        status = 200
+        start = perf_counter()
+        try:
+            return await self._request(route, **kwargs)
+        except discord.HTTPException as e:
+            status = e.status
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+            if self.metrics is not None:
+                self.metrics.observe("discord", perf_counter() - start, route=name, status=status)
+
+    def stats(self):
+        return {name: dict(stats) for name, stats in self.routes.items()}
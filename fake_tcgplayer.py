@@ -0,0 +1,152 @@
+"""A local stand-in for the TCGPlayer API, for benchmarks and offline runs.
+
+Serves a synthetic, deterministic catalog over the endpoints the bot uses,
+with configurable latency and injected 500s and 429s."""
+import random
+import asyncio
+from collections import Counter
+from aiohttp import web
+
+GAMES = {"Pokemon": 3, "Magic": 1, "YuGiOh": 2, "Cardfight Vanguard": 16}
+SUB_TYPES = ("Normal", "Holofoil", "Reverse Holofoil")
+WORDS = (
+    "charizard pikachu mewtwo lugia ho-oh rayquaza greninja zoroark lightning bolt dragon zombie "
+    "extremely slow blue eyes white dark magician elf sword shield sun moon gx ex full art secret "
+    "rare promo shiny legends storm guardians rising burning shadows crimson invasion ultra prism"
+).split()
+
+
+class FakeTCGPlayer:
+    def __init__(self, products_per_group=50, groups_per_game=100, latency=0.05, jitter=0.02,
+                 error_rate=0.0, throttle_rate=0.0, public_key="benchmark", seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.public_key = public_key
+        self.random = random.Random(seed)
+        self.requests = Counter()
+
+        self.groups = {}
+        self.products = {}
+        product_id = 1
+        for game, category_id in GAMES.items():
+            for g in range(groups_per_game):
+                group_id = category_id * 1000 + g
+                self.groups[group_id] = {
+                    "groupId": group_id, "categoryId": category_id, "name": f"{game} Set {g}",
+                    "abbreviation": f"S{g}", "modifiedOn": "2018-01-01T00:00:00",
+                }
+                for _ in range(products_per_group):
+                    name = " ".join(self.random.choice(WORDS) for _ in range(self.random.randint(1, 3)))
+                    self.products[product_id] = {
+                        "productId": product_id, "categoryId": category_id, "groupId": group_id,
+                        "name": name.title(), "cleanName": name.title(),
+                        "imageUrl": f"https://example.com/{product_id}.jpg",
+                        "url": f"https://example.com/product/{product_id}",
+                        "modifiedOn": "2018-01-01T00:00:00",
+                        "extendedData": [{"name": "Rarity", "displayName": "Rarity", "value": "Rare"}],
+                    }
+                    product_id += 1
+
+        self.app = web.Application(middlewares=[self.middleware])
+        router = self.app.router
+        router.add_post("/token", self.token)
+        router.add_get("/v/catalog/categories", self.categories)
+        router.add_get("/v/catalog/categories/{id}/search/manifest", self.manifest)
+        router.add_post("/v/catalog/categories/{id}/search", self.search)
+        router.add_get("/v/catalog/categories/{id}/groups", self.category_groups)
+        router.add_get("/v/catalog/groups/{ids}", self.groups_by_id)
+        router.add_get("/v/catalog/products", self.product_listing)
+        router.add_get("/v/catalog/products/{ids}", self.products_by_id)
+        router.add_get("/v/pricing/product/{ids}", self.prices)
+        self._runner = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving, returning (token url, api base)"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/token", f"http://{host}:{port}/v"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else "?"
+        self.requests[f"{request.method} {route}"] += 1
+        await asyncio.sleep(max(0.0, self.random.gauss(self.latency, self.jitter)))
+        if self.random.random() < self.throttle_rate:
+            return web.json_response({"errors": ["Too many requests"]}, status=429, headers={"Retry-After": "1"})
+        if self.random.random() < self.error_rate:
+            return web.json_response({"errors": ["Injected failure"]}, status=500)
+        return await handler(request)
+
+    @staticmethod
+    def _ids(request):
+        return [int(x) for x in request.match_info["ids"].split(",") if x]
+
+    @staticmethod
+    def _page(request, items):
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", 100))
+        return web.json_response({"totalItems": len(items), "results": items[offset:offset + limit]})
+
+    async def token(self, request):
+        return web.json_response({
+            "access_token": "fake-token", "token_type": "bearer", "expires_in": 1209599,
+            "userName": self.public_key,
+        })
+
+    async def categories(self, request):
+        return web.json_response({"results": [{"categoryId": id, "name": name} for name, id in GAMES.items()]})
+
+    async def manifest(self, request):
+        return web.json_response({"results": [{"sorting": [
+            {"text": "Relevance", "value": "Relevance"}, {"text": "Name", "value": "name"},
+        ]}]})
+
+    async def search(self, request):
+        category_id = int(request.match_info["id"])
+        body = await request.json()
+        names = [f for f in body.get("filters", []) if f["name"] == "productName"]
+        query = names[0]["values"][0].lower() if names else ""
+        found = [p["productId"] for p in self.products.values()
+                 if p["categoryId"] == category_id and query in p["name"].lower()][:body.get("limit", 100)]
+        if not found:
+            return web.json_response({"errors": ["No products were found."], "results": []}, status=404)
+        return web.json_response({"totalItems": len(found), "results": found})
+
+    async def category_groups(self, request):
+        category_id = int(request.match_info["id"])
+        return self._page(request, [g for g in self.groups.values() if g["categoryId"] == category_id])
+
+    async def groups_by_id(self, request):
+        found = [self.groups[x] for x in self._ids(request) if x in self.groups]
+        return web.json_response({"results": found}, status=200 if found else 404)
+
+    async def product_listing(self, request):
+        if "groupId" in request.query:
+            group_id = int(request.query["groupId"])
+            return self._page(request, [p for p in self.products.values() if p["groupId"] == group_id])
+        category_id = int(request.query["categoryId"])
+        return self._page(request, [p for p in self.products.values() if p["categoryId"] == category_id])
+
+    async def products_by_id(self, request):
+        found = [self.products[x] for x in self._ids(request) if x in self.products]
+        return web.json_response({"results": found}, status=200 if found else 404)
+
+    async def prices(self, request):
+        results = []
+        for x in self._ids(request):
+            if x in self.products:
+                base = (x % 97) / 4 + 0.1
+                for i, sub_type in enumerate(SUB_TYPES[:1 + x % 3]):
+                    results.append({
+                        "productId": x, "subTypeName": sub_type, "lowPrice": base, "midPrice": base * (i + 1.5),
+                        "highPrice": base * 4, "marketPrice": round(base * (i + 1), 2), "directLowPrice": None,
+                    })
+        return web.json_response({"results": results}, status=200 if results else 404)
@@ -0,0 +1,57 @@
+import heapq
+from itertools import count, repeat
+from collections import Counter
+
+
+class LatencyTracker:
+    """Exponentially weighted average latency per category, for telling which ones to skip when busy.
+
+    A category is slow when its average is over `threshold` seconds or
+    `ratio` times the fastest one's. A slow category still gets every
+    `probe`th search, so its average can recover once it's fast again. A
+    search that failed counts as taking at least `threshold` seconds."""
+
+    def __init__(self, alpha=0.2, threshold=2.0, ratio=4.0, probe=10):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.ratio = ratio
+        self.probe = probe
+        self.averages = {}
+        self.slowed = Counter()
+        self.skipped = Counter()
+
+    def observe(self, key, seconds, failed=False):
+        if failed:
+            seconds = max(seconds, self.threshold)
+        average = self.averages.get(key)
+        self.averages[key] = seconds if average is None else average + self.alpha * (seconds - average)
+
+    def slow(self, key):
+        average = self.averages.get(key)
+        if average is None:
+            return False
+        return average > self.threshold or average > self.ratio * min(self.averages.values())
+
+    def skip(self, key):
+        """Whether to leave a slow category out of this search, counting it if so"""
+        if not self.slow(key):
+            return False
+        self.slowed[key] += 1
+        if self.slowed[key] % self.probe == 0:
+            return False
+        self.skipped[key] += 1
+        return True
+
+    def stats(self):
+        return {key: {"average": average, "skipped": self.skipped[key]} for key, average in self.averages.items()}
+
+
+def merge_ranked(streams, fixed=()):
+    """Items of several best-first lists in one best-first order.
+
+    A k-way merge by rank: every list's best, then every list's second
+    best and so on, ties going to the list that came first. Items in fixed
+    (already shown) stay in front in their order."""
+    seen = {id(item) for item in fixed}
+    merged = heapq.merge(*(zip(count(), repeat(n), stream) for n, stream in enumerate(streams)))
+    return list(fixed) + [item for _, _, item in merged if id(item) not in seen]
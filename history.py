@@ -0,0 +1,261 @@
+import time
+import asyncio
+from array import array
+from collections import Counter, defaultdict
+from traceback import print_exc
+
+from store import connect, select_in
+
+DAY = 24 * 60 * 60
+NAN = float("nan")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    productId INTEGER NOT NULL,
+    subType TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    prices BLOB NOT NULL,
+    PRIMARY KEY (productId, subType, step, block)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_age ON history (step, block);
+CREATE TABLE IF NOT EXISTS products (
+    productId INTEGER PRIMARY KEY,
+    categoryId INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_category ON products (categoryId);
+"""
+
+SPARKS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(prices, width=30):
+    """Prices as a line of block characters, averaged down to at most width of them"""
+    if not prices:
+        return ""
+    size = max(1, -(-len(prices) // width))
+    points = [sum(prices[i:i + size]) / len(prices[i:i + size]) for i in range(0, len(prices), size)]
+    low, high = min(points), max(points)
+    scale = (len(SPARKS) - 1) / (high - low) if high > low else 0
+    return "".join(SPARKS[round((p - low) * scale)] for p in points)
+
+
+def change(first, last):
+    return (last - first) / first * 100 if first else 0.0
+
+
+def summarize(prices):
+    """First, last, min, max and change in percent of a run of prices"""
+    first, last = prices[0], prices[-1]
+    return {"first": first, "last": last, "min": min(prices), "max": max(prices), "change": change(first, last)}
+
+
+def _mean(prices):
+    known = [p for p in prices if p == p]
+    return sum(known) / len(known) if known else NAN
+
+
+class PriceHistory:
+    """Market prices over time per (productId, sub type), on disk.
+
+    Each level keeps one price per `step` seconds for `retention` seconds, in
+    rows of `slots` packed floats (NaN where nothing was sampled). A level's
+    row spans exactly one step of the next level, which holds that row's
+    mean, so hourly samples are downsampled to days as they're recorded.
+    Queries read only the rows in range, for any number of products, and
+    each product's category is kept so they can be narrowed to one game."""
+
+    # (step, slots per row, retention)
+    LEVELS = (
+        (60 * 60, 24, 14 * DAY),
+        (DAY, 32, 2 * 365 * DAY),
+    )
+    def __init__(self, path="history.db"):
+        self.db = connect(path, SCHEMA)
+
+    def _rows(self, product_ids, step, first, last):
+        return select_in(self.db, "SELECT productId, subType, block, prices FROM history "
+                                  "WHERE step = ? AND block BETWEEN ? AND ? AND productId IN ({ids}) ORDER BY block",
+                         product_ids, step, first, last)
+
+    def record(self, samples, when=None):
+        """Store {(productId, sub type): price} as sampled at when, now by default"""
+        if not samples:
+            return
+        when = time.time() if when is None else when
+        with self.db:
+            # Take the write lock before reading so processes don't overwrite each other's samples
+            self.db.execute("BEGIN IMMEDIATE")
+            for step, slots, _ in self.LEVELS:
+                block, offset = divmod(int(when // step), slots)
+                rows = {(product_id, sub_type): array('f', prices) for product_id, sub_type, _, prices
+                        in self._rows({product_id for product_id, _ in samples}, step, block, block)}
+                for key, price in samples.items():
+                    prices = rows.get(key)
+                    if prices is None:
+                        prices = rows[key] = array('f', [NAN]) * slots
+                    prices[offset] = price
+
+                self.db.executemany("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?)", (
+                    (product_id, sub_type, step, block, rows[product_id, sub_type].tobytes())
+                    for product_id, sub_type in samples
+                ))
+                samples = {key: _mean(rows[key]) for key in samples}
+
+    def level(self, start):
+        """The finest level that still covers start"""
+        age = time.time() - start
+        for level in self.LEVELS:
+            if age <= level[2]:
+                return level
+        return self.LEVELS[-1]
+
+    def series(self, product_ids, start, end=None):
+        """{productId: {sub type: [(time, price), ...]}} between start and end"""
+        end = time.time() if end is None else end
+        step, slots, _ = self.level(start)
+        first, last = int(start // step), int(end // step)
+
+        found = defaultdict(lambda: defaultdict(list))
+        for product_id, sub_type, block, prices in self._rows(product_ids, step, first // slots, last // slots):
+            points = found[product_id][sub_type]
+            for slot, price in enumerate(array('f', prices), block * slots):
+                if first <= slot <= last and price == price:
+                    points.append((slot * step, price))
+        return found
+
+    def summary(self, product_ids, start, end=None):
+        """{productId: {sub type: summarize(prices)}} between start and end.
+
+        Worked out a row at a time as they're read, without building the series."""
+        end = time.time() if end is None else end
+        step, slots, _ = self.level(start)
+        first, last = int(start // step), int(end // step)
+
+        found = defaultdict(dict)
+        for product_id, sub_type, block, prices in self._rows(product_ids, step, first // slots, last // slots):
+            offset = block * slots
+            known = [price for price in array('f', prices)[max(first - offset, 0):last - offset + 1] if price == price]
+            if not known:
+                continue
+            stats = found[product_id].get(sub_type)
+            if stats is None:
+                found[product_id][sub_type] = {"first": known[0], "last": known[-1],
+                                               "min": min(known), "max": max(known)}
+            else:
+                # Rows come in block order, so this one is later than the ones already seen
+                stats["last"] = known[-1]
+                stats["min"] = min(stats["min"], *known)
+                stats["max"] = max(stats["max"], *known)
+
+        for sub_types in found.values():
+            for stats in sub_types.values():
+                stats["change"] = change(stats["first"], stats["last"])
+        return found
+
+    def categorize(self, categories):
+        """Remember {productId: categoryId}"""
+        if categories:
+            with self.db:
+                self.db.executemany("INSERT OR IGNORE INTO products VALUES (?, ?)", categories.items())
+
+    def tracked(self, start, category_id=None):
+        """Ids of the products with prices since start, only those in category_id if given"""
+        step, slots, _ = self.level(start)
+        if category_id is None:
+            rows = self.db.execute("SELECT DISTINCT productId FROM history WHERE step = ? AND block >= ?",
+                                   (step, int(start // step) // slots))
+        else:
+            rows = self.db.execute("SELECT DISTINCT productId FROM history JOIN products USING (productId) "
+                                   "WHERE categoryId = ? AND step = ? AND block >= ?",
+                                   (category_id, step, int(start // step) // slots))
+        return [row[0] for row in rows]
+
+    def uncategorized(self, start):
+        """Ids of the products with prices since start whose category isn't known"""
+        step, slots, _ = self.level(start)
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT productId FROM history WHERE step = ? AND block >= ? "
+            "AND productId NOT IN (SELECT productId FROM products)", (step, int(start // step) // slots)
+        )]
+
+    def purge(self):
+        """Drop the rows every level has kept for longer than its retention"""
+        now = time.time()
+        with self.db:
+            for step, slots, retention in self.LEVELS:
+                self.db.execute("DELETE FROM history WHERE step = ? AND block < ?",
+                                (step, int((now - retention) // step) // slots))
+
+    def stats(self):
+        return {step: {"rows": n} for step, n in
+                self.db.execute("SELECT step, COUNT(*) FROM history GROUP BY step")}
+
+
+class PriceCollector:
+    """Feeds a PriceHistory once per `interval` seconds.
+
+    Prices that commands fetched anyway are kept as they come in and counted
+    towards their products' popularity. Each round the most popular products
+    are priced in bulk on the background lane; with claim, only one of the
+    bot's processes does that per round. Watched products come in through
+    observe, as the watchlist prices them anyway."""
+
+    def __init__(self, history, sample, interval=60 * 60, popular=1000, claim=None):
+        self.history = history
+        self.sample = sample
+        self.interval = interval
+        self.popular = popular
+        self.claim = claim
+        self.popularity = Counter()
+        self.pending = {}
+        self.categories = {}
+        self.sampled = 0
+
+    def observe(self, prices, popular=True, category_id=None):
+        """Keep {productId: (Price, ...)} for the next round, along with their category if given"""
+        if category_id is not None:
+            self.categorize(dict.fromkeys(prices, category_id))
+        for product_id, rows in prices.items():
+            if popular:
+                self.popularity[product_id] += 1
+            for price in rows:
+                if price.market is not None:
+                    self.pending[product_id, price.sub_type_name] = price.market
+
+    def categorize(self, categories):
+        """Keep {productId: categoryId} for the next round"""
+        self.categories.update(categories)
+
+    async def collect(self):
+        now = time.time()
+        # Observed during the round that just ended, so they belong in its slot
+        observed, self.pending = self.pending, {}
+        categories, self.categories = self.categories, {}
+        self.history.record(observed, now - now % self.interval - 1)
+        self.history.categorize(categories)
+
+        if self.claim is None or self.claim(self.interval / 2):
+            ids = [product_id for product_id, _ in self.popularity.most_common(self.popular)]
+            samples = {(product_id, price.sub_type_name): price.market
+                       for product_id, rows in (await self.sample(ids)).items()
+                       for price in rows if price.market is not None}
+            self.history.record(samples)
+            self.history.purge()
+            self.sampled += len(samples)
+
+        # Halving every round makes popularity follow what is being looked up lately
+        self.popularity = Counter({x: n // 2 for x, n in self.popularity.items() if n > 1})
+
+    async def run(self):
+        while True:
+            # Rounds start on the interval boundary so each one fills its own slot
+            await asyncio.sleep(self.interval - time.time() % self.interval)
+            try:
+                await self.collect()
+            except Exception:
+                print_exc()
+
+    def stats(self):
+        return {"collector": {"pending": len(self.pending), "popular": len(self.popularity),
+                              "sampled": self.sampled}}
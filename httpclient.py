@@ -0,0 +1,134 @@
+import aiohttp
+from time import perf_counter
+from types import MappingProxyType
+from collections import Counter
+from urllib.parse import urlsplit
+from contextlib import asynccontextmanager
+
+from metrics import endpoint
+from ratelimit import INTERACTIVE, RequestScheduler, retry_after
+
+API_BASE = "https://api.tcgplayer.com/v1.37.0"
+
+
+class HTTPClient:
+    """The one pooled aiohttp session everything the bot fetches goes through.
+
+    Paths starting with / are TCGPlayer API calls: they wait for `authorize`
+    (the first token, see Credentials), get the current auth headers and
+    wait for a slot from the scheduler in their lane. Anything else is
+    requested as a plain URL."""
+
+    RETRIES_429 = 3
+
+    def __init__(self, api_base=API_BASE, session=None, scheduler=None, limit=100, limit_per_host=30,
+                 dns_ttl=300, keepalive=60, timeout=30, connect_timeout=10, metrics=None):
+        self.api_base = api_base
+        self.scheduler = scheduler or RequestScheduler()
+        self.metrics = metrics
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session = session
+        self.authorize = None
+
+        self.headers = MappingProxyType({"Accept": "application/json", "Content-Type": "application/json"})
+        self.requests = Counter()
+        self.failures = Counter()
+        self.request_time = Counter()
+        self.in_flight = 0
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    def set_token(self, token):
+        # The new mapping is complete before it replaces the old one, so a
+        # request either sees the old token or the new one, never a mix
+        self.headers = MappingProxyType({
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}",
+        })
+
+    @asynccontextmanager
+    async def request(self, method, url, *, timeout=None, lane=INTERACTIVE, **kwargs):
+        """Like session.request, with a per-request timeout in seconds"""
+        if url.startswith("/"):
+            route = endpoint(method, url)
+            url = self.api_base + url
+            if self.authorize is not None:
+                await self.authorize()
+            kwargs["headers"] = {**self.headers, **kwargs.get("headers", {})}
+            async with self.scheduler.slot(lane):
+                async with self._request(method, url, timeout, route, **kwargs) as response:
+                    yield response
+        else:
+            async with self._request(method, url, timeout, f"{method} {urlsplit(url).hostname}", **kwargs) as response:
+                yield response
+
+    @asynccontextmanager
+    async def _request(self, method, url, timeout, route, **kwargs):
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+        host = urlsplit(url).hostname
+        self.requests[host] += 1
+        self.in_flight += 1
+        status = "error"
+        start = perf_counter()
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                status = response.status
+                yield response
+        except Exception:
+            self.failures[host] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            elapsed = perf_counter() - start
+            self.request_time[host] += elapsed
+            if self.metrics is not None:
+                self.metrics.observe("upstream", elapsed, endpoint=route, status=status)
+
+    async def json(self, method, url, **kwargs):
+        for attempt in range(self.RETRIES_429 + 1):
+            async with self.request(method, url, **kwargs) as response:
+                if response.status == 429 and url.startswith("/"):
+                    self.scheduler.throttle(retry_after(response))
+                    if attempt < self.RETRIES_429:
+                        continue
+                response.raise_for_status()
+                if url.startswith("/"):
+                    self.scheduler.success()
+                return await response.json()
+
+    async def get_json(self, url, lane=INTERACTIVE, **params):
+        return await self.json("GET", url, lane=lane, params=params)
+
+    def pool_stats(self):
+        connector = self.session.connector
+        return {
+            "limit": connector.limit,
+            "limit_per_host": connector.limit_per_host,
+            "active": len(getattr(connector, "_acquired", ())),
+            "idle": sum(len(conns) for conns in getattr(connector, "_conns", {}).values()),
+            "in_flight": self.in_flight,
+            "requests": sum(self.requests.values()),
+            "failures": sum(self.failures.values()),
+        }
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,108 @@
+"""Run the bot as several processes, each connecting a slice of the shards.
+
+The processes share the TCGPlayer token, manifests and caches through one
+SQLite file, so adding processes doesn't add TCGPlayer traffic.
+
+    python launcher.py --processes 4
+    python launcher.py --processes 2 --shards 8
+"""
+import os
+import json
+import time
+import signal
+import argparse
+import urllib.request
+import multiprocessing
+
+GATEWAY_URL = "https://discord.com/api/v7/gateway/bot"
+
+
+def recommended_shards(token):
+    request = urllib.request.Request(GATEWAY_URL, headers={
+        "Authorization": f"Bot {token}", "User-Agent": "CardBuddy launcher",
+    })
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)["shards"]
+
+
+def split(shard_count, processes):
+    """Contiguous shard id ranges, as even as they can be"""
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        end = start + size + (i < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return [ids for ids in ranges if ids]
+
+
+def worker(index, shard_ids, shard_count, shared_path):
+    # Each process gets its own metrics port/file so they don't collide
+    if os.environ.get("METRICS_PORT"):
+        os.environ["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + index)
+    if os.environ.get("METRICS_FILE"):
+        root, ext = os.path.splitext(os.environ["METRICS_FILE"])
+        os.environ["METRICS_FILE"] = f"{root}.{index}{ext}"
+
+    from main import Bot
+    from store import SharedStore
+
+    bot = Bot(shard_ids=shard_ids, shard_count=shard_count, shared=SharedStore(shared_path))
+    bot.run(bot.auth[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--shards", type=int, help="total shard count, Discord's recommendation by default")
+    parser.add_argument("--shared", default="shared.db", help="path of the store the processes share")
+    args = parser.parse_args()
+
+    with open("auth.json") as fd:
+        token = json.load(fd)[0]
+    shard_count = args.shards or recommended_shards(token)
+    ranges = split(shard_count, args.processes)
+    print(f"Running {shard_count} shards in {len(ranges)} processes: {ranges}")
+
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    started = [0.0] * len(ranges)
+    restarts = [0] * len(ranges)
+
+    def start(index):
+        process = context.Process(target=worker, args=(index, ranges[index], shard_count, args.shared),
+                                  name=f"cardbuddy-{index}")
+        process.start()
+        processes[index] = process
+        started[index] = time.monotonic()
+
+    def stop(*_):
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+        raise SystemExit
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(len(ranges)):
+        start(index)
+
+    # Restart any process that dies, backing off if it keeps dying
+    while True:
+        time.sleep(5)
+        for index, process in list(processes.items()):
+            if not process.is_alive():
+                if time.monotonic() - started[index] > 600:
+                    restarts[index] = 0
+                restarts[index] += 1
+                delay = min(300, 2 ** restarts[index])
+                print(f"Process {index} (shards {ranges[index]}) exited with {process.exitcode}, "
+                      f"restarting in {delay}s")
+                time.sleep(delay)
+                start(index)
+
+
+if __name__ == "__main__":
+    main()
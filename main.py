@@ -1,34 +1,68 @@
 import io
 import os
+import csv
 import json
+import time
 import copy
-import psutil
 import random
-import aiohttp
 import asyncio
 import discord
 import datetime
+from time import perf_counter
 from textwrap import indent
+from functools import partial
 from collections import Counter
-from traceback import format_exc
+from traceback import format_exc, print_exc
 from discord.ext import commands
-from urllib.parse import urlencode
 from contextlib import redirect_stdout
 
-with open("auth.json") as wf:
-    auth = json.load(wf)
-
-
-class Bot(commands.Bot):
-    BEARER_TOKEN = None
-    PUBLIC_KEY = auth[1]
-    PRIVATE_KEY = auth[2]
-
+from api import TCGPlayerAPI
+from cache import default_caches
+from catalog import CatalogStore, CatalogSync
+from decklist import Deck, DecklistParser, Valuer
+from discordio import DiscordIO
+from fanout import LatencyTracker, merge_ranked
+from history import DAY, PriceHistory, PriceCollector, sparkline, summarize
+from ptcgo import PTCGOStore
+from httpclient import HTTPClient
+from metrics import Metrics
+from paginator import Paginator
+from render import Renderer
+from ratelimit import BACKGROUND
+from timerwheel import TimerWheel
+from watchlist import WatchStore, Watchlist
+from store import ResponseStore
+from suggest import Suggester
+
+
+def load_auth(path="auth.json"):
+    """[discord token, TCGPlayer public key, TCGPlayer private key, bots.discord.pw key, discordbots.org key]"""
+    with open(path) as wf:
+        return json.load(wf)
+
+
+class Bot(commands.AutoShardedBot):
     started = False
-    session = None
-
-    def __init__(self):
-        super().__init__("c!")
+    warmed = False
+    sync_catalog = True
+
+    def __init__(self, shard_ids=None, shard_count=None, shared=None, auth=None):
+        """Runs every shard by default, or only shard_ids when launcher.py splits them over processes,
+        which then share the token, manifests and caches through shared"""
+        self.launched = perf_counter()
+        self.startup = {}
+        super().__init__("c!", shard_ids=shard_ids, shard_count=shard_count)
+        self.auth = load_auth() if auth is None else auth
+        self.PUBLIC_KEY, self.PRIVATE_KEY = self.auth[1], self.auth[2]
+        self.shared = shared
+        self.caches = default_caches(shared)
+        self.metrics = Metrics()
+        self.discord_io = DiscordIO(self.http, metrics=self.metrics)
+        # Not self.http, discord.py already uses that for its own REST client
+        self.web = HTTPClient(metrics=self.metrics)
+        self.tcg = TCGPlayerAPI(self.PUBLIC_KEY, self.PRIVATE_KEY, http=self.web, caches=self.caches,
+                                store=CatalogStore(), shared=shared, responses=ResponseStore())
+        self.credentials = self.tcg.credentials
         self.cmdobj = Commands(self)
         self.add_cog(self.cmdobj)
         self.add_cog(Administration(self))
@@ -37,16 +71,73 @@ class Bot(commands.Bot):
         self.server_commands = Counter()
         self.socket_stats = Counter()
 
+        self.metrics.gauge("cache", lambda: {name: cache.stats() for name, cache in self.caches.items()}, "cache")
+        self.metrics.gauge("batch", self.tcg.batch_stats, "batcher")
+        self.metrics.gauge("responses", self.tcg.response_stats, "kind")
+        self.metrics.gauge("history", lambda: {**self.cmdobj.price_history.stats(),
+                                               **self.cmdobj.collector.stats()}, "level")
+        self.metrics.gauge("watchlist", self.cmdobj.watchlist.stats, "part")
+        self.metrics.gauge("pool", lambda: {"tcgplayer": self.web.pool_stats()}, "pool")
+        self.metrics.gauge("discord", self.discord_io.stats, "route")
+        self.metrics.gauge("fanout", self.cmdobj.latency.stats, "category")
+        self.metrics.gauge("startup", lambda: {stage: {"seconds": t} for stage, t in self.startup.items()}, "stage")
+        self.before_invoke(self.start_timer)
+        self.after_invoke(self.stop_timer)
+
+    @property
+    def BEARER_TOKEN(self):
+        return self.credentials.token
+
+    async def start(self, *args, **kwargs):
+        self.warm()
+        await super().start(*args, **kwargs)
+
+    def warm(self):
+        """Start loading everything commands need, without waiting for any of it"""
+        if self.warmed:
+            return
+        self.warmed = True
+
+        if self.credentials.load_snapshot():
+            # Lets commands answer from the last run's manifests until the first refresh is done
+            self.cmdobj.load_manifests()
+            self.mark_startup("snapshot")
+        self.loop.create_task(self.credentials.run(self.cmdobj.prep))
+        self.loop.create_task(self.cmdobj.ptcgo_store())
+        self.loop.create_task(self.cmdobj.collector.run())
+        self.cmdobj.watchlist.start()
+
+    def mark_startup(self, stage):
+        """Record how long after launch stage was first reached"""
+        if stage not in self.startup:
+            self.startup[stage] = perf_counter() - self.launched
+            print(f"Startup: {stage} after {self.startup[stage]:.2f}s")
+
     async def on_ready(self):
+        self.mark_startup("connected")
         if not self.started:
-            self.loop.create_task(self.refresh())
             self.started = True
 
             self.loop.create_task(self.update_stats())
 
+            # For dashboards: METRICS_FILE is rewritten every 15s (Prometheus text if it ends in .prom,
+            # JSON otherwise) and METRICS_PORT serves the same on /metrics
+            if os.environ.get("METRICS_FILE"):
+                self.loop.create_task(self.metrics.run_dump(os.environ["METRICS_FILE"]))
+            if os.environ.get("METRICS_PORT"):
+                await self.metrics.serve(port=int(os.environ["METRICS_PORT"]))
+
     async def on_command(self, ctx):
         self.commands_used[ctx.command] += 1
 
+    async def start_timer(self, ctx):
+        ctx.started = perf_counter()
+
+    async def stop_timer(self, ctx):
+        self.mark_startup("first_command")
+        self.metrics.observe("command", perf_counter() - ctx.started, command=ctx.command.qualified_name,
+                             failed=ctx.command_failed)
+
     async def on_socket_response(self, msg):
         self.socket_stats[msg.get('t')] += 1
 
@@ -68,48 +159,38 @@ class Bot(commands.Bot):
     async def update_stats(self):
         url = "https://bots.discord.pw/api/bots/{}/stats".format(self.user.id)
         while not self.is_closed():
-            payload = json.dumps(dict(server_count=len(self.guilds))).encode()
-            headers = {'authorization': auth[3], "Content-Type": "application/json"}
+            servers = self.server_count()
+            if self.shard_ids is not None and 0 not in self.shard_ids:
+                # The process running shard 0 posts the total for everyone
+                await asyncio.sleep(14400)
+                continue
 
-            async with self.session.post(url, data=payload, headers=headers) as response:
+            payload = json.dumps(dict(server_count=servers)).encode()
+            headers = {'authorization': self.auth[3], "Content-Type": "application/json"}
+
+            async with self.web.request("POST", url, data=payload, headers=headers, timeout=30) as response:
                 await response.read()
 
             url = "https://discordbots.org/api/bots/{}/stats".format(self.user.id)
-            payload = json.dumps(dict(server_count=len(self.guilds))).encode()
-            headers = {'authorization': auth[4], "Content-Type": "application/json"}
+            payload = json.dumps(dict(server_count=servers)).encode()
+            headers = {'authorization': self.auth[4], "Content-Type": "application/json"}
 
-            async with self.session.post(url, data=payload, headers=headers) as response:
+            async with self.web.request("POST", url, data=payload, headers=headers, timeout=30) as response:
                 await response.read()
 
             await asyncio.sleep(14400)
 
-    async def refresh(self):
-        self.session = aiohttp.ClientSession()
-
-        while True:
-            response = await self.session.get(
-                "https://api.tcgplayer.com/token",
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    # f"X-Tcg-Access-Token": "{self.ACCESS_TOKEN}"
-                },
-                data=urlencode({
-                    "grant_type": "client_credentials",
-                    "client_id": self.PUBLIC_KEY,
-                    "client_secret": self.PRIVATE_KEY
-                })
-            )
-            data = await response.json()
-            print(data)
-            self.BEARER_TOKEN = data["access_token"].strip()
-            assert data["userName"].lower() == self.PUBLIC_KEY.lower()
-
-            await self.cmdobj.prep()
-            await asyncio.sleep(data["expires_in"])
+    def server_count(self):
+        """Guilds across every process, when there are several"""
+        if self.shared is None:
+            return len(self.guilds)
+        self.shared.set("guilds", self.shard_ids, len(self.guilds), 5 * 60 * 60)
+        return sum(self.shared.items("guilds").values())
 
     @staticmethod
     def get_ram():
         """Get the bot's RAM usage info."""
+        import psutil
         mem = psutil.virtual_memory()
         return f"{mem.used / 0x40_000_000:.2f}/{mem.total / 0x40_000_000:.2f}GB ({mem.percent}%)"
 
@@ -117,64 +198,140 @@ class Bot(commands.Bot):
 class Commands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-
-    API_BASE = "https://api.tcgplayer.com/v1.37.0"
-    manifests: dict
-    categories: dict
+        claim = None if bot.shared is None else partial(bot.shared.claim, "catalog sync")
+        self.catalog = CatalogSync(bot.tcg.store, partial(bot.tcg.paged, lane=BACKGROUND), claim=claim)
+        self.catalog_task = None
+        self._ptcgo = None
+        self._analytics = None
+        self._ptcgo_names = None
+        self.wheel = TimerWheel()
+        self.paginator = Paginator(bot, wheel=self.wheel, metrics=bot.metrics)
+        self.renderer = Renderer(bot.caches["embed"], self.AFFILIATE, metrics=bot.metrics)
+        self.latency = LatencyTracker()
+        self.valuer = Valuer(bot.tcg, self.catalog)
+        self.price_history = PriceHistory()
+        claim = None if bot.shared is None else partial(bot.shared.claim, "price history")
+        self.collector = PriceCollector(self.price_history, bot.tcg.sample_prices, claim=claim)
+        claim = None if bot.shared is None else partial(bot.shared.claim, "watchlist")
+        self.watchlist = Watchlist(WatchStore(), self.sample_watched, self.alert, wheel=self.wheel,
+                                   metrics=bot.metrics, claim=claim)
+
+    AFFILIATE = "?partner={a}&utm_campaign=affiliate&utm_medium={a}&utm_source={a}".format(a="CardBuddy")
+    MAX_WATCHES = 25
+    CROSS_GAME_RESULTS = 25
+    MAX_DECKLIST_BYTES = 2 * 1024 * 1024
+    manifests: dict = None
+    categories: dict = None
     POKEMON_ID: int
     MAGIC_ID: int
     YUGIOH_ID: int
     VANGUARD_ID: int
 
-    with open("files.json", 'r') as fd:
-        ocarddata = json.load(fd)
+    def load_manifests(self):
+        credentials = self.bot.credentials
+        self.manifests = credentials.manifests
+        self.categories = credentials.categories
+        self.POKEMON_ID, self.MAGIC_ID, self.YUGIOH_ID, self.VANGUARD_ID = credentials.game_ids()
 
     async def prep(self):
-        self.manifests = {}
-
-        headers = {"accept": "application/json",
-                   "Content-Type": "application/json",
-                   "Authorization": "bearer " + self.bot.BEARER_TOKEN}
-
-        response = await self.bot.session.get(
-            f"{self.API_BASE}/catalog/categories",
-            headers=headers,
-            params={"limit": 60}
-        )
-        rjson = await response.json()
-        print(json.dumps(rjson, indent=4))
-
-        self.categories = {v["name"]: v["categoryId"] for v in rjson["results"]}
-        self.POKEMON_ID = self.categories["Pokemon"]
-        self.MAGIC_ID = self.categories["Magic"]
-        self.YUGIOH_ID = 2
-        self.VANGUARD_ID = self.categories["Cardfight Vanguard"]
-
-        for id in [self.POKEMON_ID, self.MAGIC_ID, self.YUGIOH_ID, self.VANGUARD_ID]:
-            response = await self.bot.session.get(
-                f"{self.API_BASE}/catalog/categories/{id}/search/manifest",
-                headers={
-                    "accept": "application/json",
-                    "Content-Type": "application/json",
-                    "Authorization": "bearer " + self.bot.BEARER_TOKEN
-                },
-            )
-            self.manifests[id] = await response.json()
-
-    async def get_group(self, groupid):
-        groupdata = await self.bot.session.get(
-            f"{self.API_BASE}/catalog/groups/{groupid}",
-            headers={
-                "accept": "application/json",
-                "Content-Type": "application/json",
-                "Authorization": "bearer " + self.bot.BEARER_TOKEN
-            },
-        )
-        return (await groupdata.json())['results'][0]
+        self.load_manifests()
+        self.bot.mark_startup("manifests")
+
+        credentials = self.bot.credentials
+        if self.bot.sync_catalog and self.catalog_task is None and credentials.token is not None:
+            self.catalog_task = self.bot.loop.create_task(self.catalog.run(
+                [self.POKEMON_ID, self.MAGIC_ID, self.YUGIOH_ID, self.VANGUARD_ID]
+            ))
+
+    async def ready(self, ctx):
+        """Whether the game list has loaded, telling the user to wait if it hasn't"""
+        if self.categories is None:
+            await ctx.send("I'm still starting up, try again in a few seconds!")
+            return False
+        return True
+
+    async def ptcgo_store(self):
+        """The PTCGO cards, compiled from files.json off the event loop the first time they're needed"""
+        if self._ptcgo is None:
+            self._ptcgo = self.bot.loop.run_in_executor(None, PTCGOStore)
+        return await asyncio.shield(self._ptcgo)
+
+    async def ptcgo_suggester(self):
+        if self._ptcgo_names is None:
+            self._ptcgo_names = Suggester((await self.ptcgo_store()).names())
+        return self._ptcgo_names
+
+    def did_you_mean(self, suggester, query):
+        """A line of names close to a query that found nothing, or nothing"""
+        if suggester is None:
+            return ""
+        with self.timed("suggest"):
+            names = suggester.suggest(query)
+        return "\nDid you mean " + ", ".join(f"`{name}`" for name in names) + "?" if names else ""
+
+    async def ptcgo_analytics(self):
+        """The PTCGO sheet as NumPy columns, built off the event loop the first time they're needed"""
+        if self._analytics is None:
+            self._analytics = asyncio.ensure_future(self._build_analytics())
+        return await asyncio.shield(self._analytics)
+
+    async def _build_analytics(self):
+        from analytics import PTCGOAnalytics
+        rows = (await self.ptcgo_store()).rows()
+        return await self.bot.loop.run_in_executor(None, PTCGOAnalytics.from_rows, rows)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        await self.paginator.dispatch(payload)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload):
+        await self.paginator.dispatch(payload, removed=True)
+
+    def timed(self, stage):
+        """Record how long the body takes in the stage histogram"""
+        return self.bot.metrics.timer("stage", stage=stage)
+
+    async def find(self, CAT_ID, query, sort_type="Relevance", filters=()):
+        """Product ids matching query, best first"""
+        ids = None
+        if sort_type == "Relevance" and not filters and self.catalog.searchable(CAT_ID):
+            # Plain name lookups can be answered from the local index, prices stay live
+            ids = self.catalog.index.search(query, category=CAT_ID)
+        if not ids:
+            ids = await self.bot.tcg.search(CAT_ID, query, sort=sort_type, filters=list(filters))
+        return ids
+
+    async def sample_watched(self, ids):
+        prices = await self.bot.tcg.sample_prices(ids)
+        # Priced anyway, so they go into the price history without counting as searched for
+        self.collector.observe(prices, popular=False)
+        return prices
+
+    async def alert(self, user_id, channel_id, alerts):
+        """Tell a user about their watches that hit their price, in their DMs or the channel they asked in"""
+        products = await self.bot.tcg.products({alert.watch.product_id for alert in alerts})
+        lines = []
+        for alert in alerts[:10]:
+            product = products.get(alert.watch.product_id)
+            name = product.name if product is not None else f"Product {alert.watch.product_id}"
+            url = f" <{product.url + self.AFFILIATE}>" if product is not None else ""
+            lines.append(f"**{name}** ({alert.sub_type}) is down to ${alert.price:.2f}, "
+                         f"your alert was ${alert.watch.threshold:.2f}{url}")
+        if len(alerts) > 10:
+            lines.append(f"...and {len(alerts) - 10} more, see `c!watches`")
+
+        if channel_id is None:
+            destination = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+        else:
+            destination = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+        await destination.send(f"<@{user_id}> Price alert!\n" + "\n".join(lines))
 
     @commands.command()
     async def sorting(self, ctx, game: str):
         """See available sorting options for a game. Usage: c!sorting Pokemon"""
+        if not await self.ready(ctx):
+            return
         if game not in self.categories:
             await ctx.send("That is not a valid game!")
             return
@@ -213,249 +370,511 @@ class Commands(commands.Cog):
         ctx = await ctx.bot.get_context(msg)
         await ctx.bot.invoke(ctx)
 
+    async def search_all(self, ctx, query):
+        """c!search in every game at once, showing the first page as soon as the fastest game answers.
+
+        Each game's best results are merged by rank as it answers; pages the
+        user has already seen keep their place. While TCGPlayer requests are
+        queueing, games that have been answering slowly are left out."""
+        tcg = self.bot.tcg
+        busy = self.bot.web.scheduler.busy()
+        games = [game for game in self.bot.credentials.GAMES if game in self.categories]
+        skipped = [game for game in games if busy and self.latency.skip(self.categories[game])]
+        for game in skipped:
+            self.bot.metrics.inc("fanout_skipped", game=game)
+
+        async def fetch(game):
+            CAT_ID = self.categories[game]
+            start = perf_counter()
+            try:
+                ids = (await self.find(CAT_ID, query))[:self.CROSS_GAME_RESULTS]
+                if not ids:
+                    products, prices = {}, {}
+                else:
+                    products, prices = await asyncio.gather(tcg.products(ids), tcg.prices(ids))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A game that times out or errors counts as slow, or it would never be left out
+                self.latency.observe(CAT_ID, perf_counter() - start, failed=True)
+                self.bot.metrics.observe("fanout", perf_counter() - start, game=game, status="error")
+                raise
+            elapsed = perf_counter() - start
+            self.latency.observe(CAT_ID, elapsed)
+            self.bot.metrics.observe("fanout", elapsed, game=game, status="ok")
+            return CAT_ID, [products[x] for x in ids if x in products], prices
+
+        tasks = [asyncio.ensure_future(fetch(game)) for game in games if game not in skipped]
+        pending = set(tasks)
+        streams, prices, results = [], {}, []
+        message = session = closed = None
+
+        async def page(index):
+            card = results[index]
+            return self.renderer.card(card, await tcg.group(card.group_id), prices.get(card.product_id, ()),
+                                      index, len(results))
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending if closed is None else pending | {closed},
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    # The user closed the message or it timed out, nobody is waiting for the rest
+                    break
+                pending -= done
+                for task in (task for task in tasks if task in done):
+                    try:
+                        CAT_ID, cards, found = task.result()
+                    except Exception:
+                        print_exc()
+                        continue
+                    if not cards:
+                        continue
+
+                    self.collector.observe(found, category_id=CAT_ID)
+                    prices.update(found)
+                    streams.append(cards)
+                    if message is None:
+                        seen = 0
+                    elif session is None:
+                        seen = 1
+                    else:
+                        seen = max(session.index, session.shown) + 1
+                    results[:] = merge_ranked(streams, results[:seen])
+
+                    if message is None:
+                        with self.timed("send"):
+                            message = await ctx.send(embed=await page(0))
+                    elif session is not None:
+                        await self.paginator.refresh(session, len(results))
+                    else:
+                        # It was showing the only result so far, now it has pages
+                        with self.timed("edit"):
+                            await message.edit(embed=await page(0))
+                    if session is None and len(results) > 1:
+                        session = await self.paginator.start(message, len(results), page)
+                        closed = asyncio.ensure_future(session.closed.wait())
+        finally:
+            for task in pending:
+                task.cancel()
+            if closed is not None:
+                closed.cancel()
+            # Collected so that cancelled or failed fetches don't log "Task exception was never retrieved"
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if message is None:
+            note = f" ({', '.join(skipped)} left out, they're answering slowly right now)" if skipped else ""
+            await ctx.send("No items found in any game" + note)
+
     @commands.command()
-    async def search(self, ctx, query: str, game: str,
+    async def search(self, ctx, query: str, game: str = None,
                      sort_type: str = "Relevance",
                      rarity: str = None, category: str = None):
         """Query the database for a card. Usage `c!search "Ho-Oh GX (Full Art)"`
-        `c!search "Extremely Slow Zombie" Magic` """
+        `c!search "Extremely Slow Zombie" Magic`, leave the game out to search every game"""
+        if not await self.ready(ctx):
+            return
+        if game is None or game.lower() == "all":
+            await self.search_all(ctx, query)
+            return
+        if game not in self.categories:
+            await ctx.send("That is not a valid game! Leave it out to search every game")
+            return
+
         async with ctx.channel.typing():
-            filters = [
-                {"name": "productName", "values": [query]}
-            ]
+            filters = []
             if rarity is not None:
                 filters.append({"name": "Rarity", "values": [i.replace("_", " ") for i in rarity.split()]})
 
             if category is not None:
                 filters.append({"name": "Category", "values": [i.replace("_", " ") for i in category.split()]})
 
-            resp = await ctx.bot.session.post(
-                f"{self.API_BASE}/catalog/categories/{self.categories[game]}/search",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.bot.BEARER_TOKEN}"
-                },
-                data=json.dumps({
-                    "sort": sort_type,
-                    "filters": filters,
-                    "limit": 100,
-                })
-            )
-            try:
-                data = await resp.json()
-            except:
-                await ctx.send("No items found")
+            tcg = self.bot.tcg
+            CAT_ID = self.categories[game]
+            with self.timed("search"):
+                ids = await self.find(CAT_ID, query, sort_type, filters)
+            if not ids:
+                await ctx.send("No items found" + self.did_you_mean(self.catalog.suggestions.get(CAT_ID), query))
                 return
-            # ids = data['results'][0]
-
-            pricedata = await ctx.bot.session.get(
-                f"{self.API_BASE}/pricing/product/" + ",".join(str(x) for x in data['results']),
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.bot.BEARER_TOKEN}"
-                },
-            )
-
-            listdata = await ctx.bot.session.get(
-                f"{self.API_BASE}/catalog/products/" + ",".join(
-                    str(x) for x in data['results']) + "?getExtendedFields=true",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.bot.BEARER_TOKEN}"
-                },
-            )
-
-            pricejson = await pricedata.json()
-            pricejson['results'].sort(key=lambda x: data['results'].index(x['productId']))
-
-            listjson = await listdata.json()
-            listjson['results'].sort(key=lambda x: data['results'].index(x['productId']))
-            emotes = "\u25c0\u25b6\u274c"
-
-            card = listjson['results'][0]
-            # print(card)
-            adata = "?partner={a}&utm_campaign=affiliate&utm_medium={a}&utm_source={a}".format(a="CardBuddy")
-            prices = filter(lambda x: x['productId'] == card['productId'], pricejson['results'])
-            # print(pricejson['results'])
-            embed = discord.Embed(title=f"{card['name']} [Item {1}/{len(data['results'])}]",
-                                  url=card['url'] + adata)
-            embed.set_image(url=card['imageUrl'])
-            group = await self.get_group(card['groupId'])
-            embed.add_field(name="Pack", value=group['name'])
-            embed.add_field(name="Type", value=group['abbreviation'])
-            for item in card['extendedData']:
-                embed.add_field(name=item['displayName'], value=item['value'])
-
-            for price in prices:
-                if price['marketPrice'] is not None:
-                    embed.add_field(name=f"Market ({price['subTypeName']})",
-                                    value=f"${price['marketPrice']}")
-
-        message = await ctx.send(embed=embed)
-
-        index = 0
-
-        for emote in emotes:
-            await message.add_reaction(emote)
-
-        def check(r, u):
-            return r.message.id == message.id
-
-        while True:
-            try:
-                r, u = await ctx.bot.wait_for('reaction_add', check=check, timeout=80)
-            except asyncio.TimeoutError:
-                await ctx.send("Timed out! Try again")
+
+            # Prices and products only depend on the ids, the first page's group only on the products
+            async def price_stage():
+                with self.timed("prices"):
+                    return await tcg.prices(ids)
+
+            async def product_stage():
+                with self.timed("products"):
+                    products = await tcg.products(ids)
+                results = [products[x] for x in ids if x in products]
+                if not results:
+                    return results, None
+                with self.timed("group"):
+                    return results, await tcg.group(results[0].group_id)
+
+            with self.timed("fetch"):
+                pricejson, (results, group) = await asyncio.gather(price_stage(), product_stage())
+            self.collector.observe(pricejson, category_id=CAT_ID)
+            if not results:
+                await ctx.send("No items found" + self.did_you_mean(self.catalog.suggestions.get(CAT_ID), query))
                 return
 
-            # if u not in [ctx.author, ctx.bot.user] or r.emoji not in emotes:
-            if u != ctx.bot.user:
-                try:
-                    await message.remove_reaction(r.emoji, u)
-                except:
-                    pass
-            else:
-                continue
+            card = results[0]
+            with self.timed("embed"):
+                embed = self.renderer.card(card, group, pricejson.get(card.product_id, ()), 0, len(results))
 
-            if r.emoji == emotes[0]:
-                if index == 0:
-                    continue
-                else:
-                    # embed.clear_fields()
-                    index -= 1
-                    for emote in emotes:
-                        await message.add_reaction(emote)
-
-            elif r.emoji == emotes[1]:
-                if index == len(data['results']) - 1:
-                    continue
-                else:
-                    # embed.clear_fields()
-                    index += 1
-                    for emote in emotes:
-                        await message.add_reaction(emote)
+        with self.timed("send"):
+            message = await ctx.send(embed=embed)
+
+        # One request for every set on the other pages while the first is read
+        groups = self.bot.loop.create_task(self.bot.tcg.groups({card.group_id for card in results}))
+
+        async def page(index):
+            # Rendered on demand, cached embeds make a page turn a lookup
+            card = results[index]
+            try:
+                group = (await asyncio.shield(groups)).get(card.group_id)
+            except Exception:
+                # The prefetch failed, so each page looks up its own set like the first one did
+                group = await tcg.group(card.group_id)
+            return self.renderer.card(card, group, pricejson.get(card.product_id, ()), index, len(results))
+
+        await self.paginator.start(message, len(results), page, on_close=groups.cancel)
+
+    @commands.command()
+    async def suggest(self, ctx, query: str, game: str):
+        """See card names that start with or are close to what you typed. Usage `c!suggest "Charizrd" Pokemon`"""
+        if not await self.ready(ctx):
+            return
+        if game not in self.categories:
+            await ctx.send("That is not a valid game!")
+            return
+
+        suggester = self.catalog.suggestions.get(self.categories[game])
+        if suggester is None:
+            await ctx.send("I don't have that game's card names yet, try again later!")
+            return
+        with self.timed("suggest"):
+            names = suggester.suggest(query, 10)
+        if not names:
+            await ctx.send("Nothing close to that, try fewer words!")
+            return
+        await ctx.send(embed=discord.Embed(title=f"Cards like {query}", description="\n".join(names)))
 
-            elif r.emoji == emotes[2]:
+    @commands.command()
+    async def history(self, ctx, query: str, game: str, days: int = 30):
+        """See how a card's price moved. Usage `c!history "Ho-Oh GX (Full Art)" Pokemon 30`"""
+        if not await self.ready(ctx):
+            return
+        if game not in self.categories:
+            await ctx.send("That is not a valid game!")
+            return
+
+        days = max(1, min(days, 730))
+        async with ctx.channel.typing():
+            ids = await self.find(self.categories[game], query)
+            card = await self.bot.tcg.product(ids[0]) if ids else None
+            if card is None:
+                await ctx.send("No items found" + self.did_you_mean(
+                    self.catalog.suggestions.get(self.categories[game]), query))
                 return
+            series = self.price_history.series([card.product_id], time.time() - days * DAY).get(card.product_id)
+
+        if not series:
+            # Priced now so the next round starts tracking it
+            self.collector.observe(await self.bot.tcg.prices([card.product_id]), category_id=card.category_id)
+            await ctx.send(f"I don't have a price history for {card.name} yet, check back in a few hours!")
+            return
 
-            card = listjson['results'][index]
-            prices = filter(lambda x: x['productId'] == card['productId'], pricejson['results'])
-            # print(cardprice)
-            embed = discord.Embed(title=f"{card['name']} [Item {index + 1}/{len(data['results'])}]",
-                                  url=card['url'])
-            embed.set_image(url=card['imageUrl'])
-            group = await self.get_group(card['groupId'])
-            embed.add_field(name="Pack", value=group['name'])
-            embed.add_field(name="Type", value=group['abbreviation'])
-            for item in card['extendedData']:
-                embed.add_field(name=item['displayName'], value=item['value'])
-
-            for price in prices:
-                if price['marketPrice'] is not None:
-                    embed.add_field(name=f"Market ({price['subTypeName']})",
-                                    value=f"${price['marketPrice']}")
-
-            await message.edit(embed=embed)
+        embed = discord.Embed(title=f"{card.name} [last {days} days]", url=card.url + self.AFFILIATE)
+        embed.set_thumbnail(url=card.image_url)
+        for sub_type, points in sorted(series.items()):
+            prices = [price for _, price in points]
+            stats = summarize(prices)
+            embed.add_field(name=f"Market ({sub_type})", inline=False,
+                            value=f"`{sparkline(prices)}`\n${stats['last']:.2f} ({stats['change']:+.1f}%), "
+                                  f"low ${stats['min']:.2f}, high ${stats['max']:.2f}")
+        await ctx.send(embed=embed)
 
     @commands.command()
-    async def random(self, ctx):
-        """View a random listing"""
+    async def movers(self, ctx, game: str, days: int = 7):
+        """See the tracked cards whose price changed most. Usage `c!movers Magic 7`"""
+        if not await self.ready(ctx):
+            return
+        if game not in self.categories:
+            await ctx.send("That is not a valid game!")
+            return
+
+        days = max(1, min(days, 730))
+        CAT_ID = self.categories[game]
         async with ctx.channel.typing():
-            while True:
-                listdata = await ctx.bot.session.get(
-                    f"{self.API_BASE}/catalog/products/" + str(random.randint(1, 100000)),
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.bot.BEARER_TOKEN}"
-                    },
-                )
-
-                listjson = await listdata.json()
-                if len(list('results')) > 0:
-                    card = listjson['results'][0]
-                    break
+            start = time.time() - days * DAY
+            # Tracked before their category was kept, the local catalog knows the synced games' ones
+            missing = self.price_history.uncategorized(start)
+            if missing and self.bot.tcg.store is not None:
+                self.price_history.categorize({x: product["categoryId"]
+                                               for x, product in self.bot.tcg.store.products(missing).items()})
+            summary = self.price_history.summary(self.price_history.tracked(start, CAT_ID), start)
+            moves = sorted(
+                ((stats["change"], product_id, sub_type, stats)
+                 for product_id, sub_types in summary.items()
+                 for sub_type, stats in sub_types.items() if stats["first"] != stats["last"]),
+                key=lambda move: -abs(move[0])
+            )[:10]
+            # Only the cards that made the list are looked up
+            products = await self.bot.tcg.products({product_id for _, product_id, _, _ in moves})
+            moves = [(change, products[product_id], sub_type, stats)
+                     for change, product_id, sub_type, stats in moves if product_id in products]
+
+        if not moves:
+            await ctx.send("No price changes tracked for that game yet!")
+            return
+
+        embed = discord.Embed(title=f"Biggest {game} price changes [last {days} days]")
+        for change, product, sub_type, stats in moves:
+            embed.add_field(name=f"{product.name} ({sub_type})", inline=False,
+                            value=f"[${stats['first']:.2f} -> ${stats['last']:.2f} ({change:+.1f}%)]"
+                                  f"({product.url + self.AFFILIATE})")
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    async def watch(self, ctx, product_id: int, price: float, where: str = "dm"):
+        """Get a message when a card's market price drops to price. Usage `c!watch 123456 4.50`,
+        `c!watch 123456 4.50 here` to be told in this channel instead of DMs"""
+        if price <= 0:
+            await ctx.send("The price has to be above $0!")
+            return
+        if self.watchlist.store.count(ctx.author.id) >= self.MAX_WATCHES:
+            await ctx.send(f"You can only watch {self.MAX_WATCHES} cards at once, `c!unwatch` some first!")
+            return
+
+        card = await self.bot.tcg.product(product_id)
+        if card is None:
+            await ctx.send("That isn't a valid product ID! You can find them at the bottom of `c!search` results")
+            return
+
+        channel_id = ctx.channel.id if where == "here" and ctx.guild is not None else None
+        watch_id = self.watchlist.store.add(ctx.author.id, channel_id, product_id, price)
+        self.collector.categorize({product_id: card.category_id})
+        await ctx.send(f"Watching **{card.name}** for ${price:.2f} or less "
+                       f"({'in this channel' if channel_id else 'in your DMs'}), `c!unwatch {watch_id}` to stop")
 
-            embed = discord.Embed(title=card['name'], url=card['url'])
-            embed.set_image(url=card['image'])
-            embed.add_field(name="Pack", value=card['group']['name'])
-            embed.add_field(name="Type", value=card['group']['abbreviation'])
-            for item in card['extendedData']:
-                embed.add_field(name=item['displayName'], value=item['value'])
+    @commands.command()
+    async def watches(self, ctx):
+        """See your price alerts"""
+        watches = self.watchlist.store.user(ctx.author.id)
+        if not watches:
+            await ctx.send("You aren't watching anything, see `c!help watch`")
+            return
 
+        products = await self.bot.tcg.products({watch.product_id for watch in watches})
+        embed = discord.Embed(title="Your price alerts")
+        for watch in watches:
+            product = products.get(watch.product_id)
+            name = product.name if product is not None else f"Product {watch.product_id}"
+            status = "hit, waiting for the price to go back up" if watch.triggered else "waiting"
+            embed.add_field(name=f"#{watch.watch_id} {name}", inline=False,
+                            value=f"${watch.threshold:.2f} or less, {status}")
         await ctx.send(embed=embed)
 
+    @commands.command()
+    async def unwatch(self, ctx, watch_id: int):
+        """Stop a price alert. Usage `c!unwatch 12`"""
+        if self.watchlist.store.remove(ctx.author.id, watch_id):
+            await ctx.send("Alert removed!")
+        else:
+            await ctx.send("You don't have an alert with that number, see `c!watches`")
+
+    @commands.command()
+    async def value(self, ctx, game: str, *, decklist: str = ""):
+        """Price a whole decklist or collection, pasted after the game or attached as a .txt or .csv file.
+        MTG Arena and PTCGO exports work as they are. Usage `c!value Magic` followed by the list"""
+        if not await self.ready(ctx):
+            return
+        if game not in self.categories:
+            await ctx.send("That is not a valid game!")
+            return
+
+        parser = DecklistParser()
+        deck = Deck()
+        async with ctx.channel.typing():
+            with self.timed("parse"):
+                for line in decklist.splitlines():
+                    deck.add(parser.feed(line))
+
+                for attachment in ctx.message.attachments[:1]:
+                    if attachment.size > self.MAX_DECKLIST_BYTES:
+                        await ctx.send("That file is too big, try splitting it up!")
+                        return
+                    # Parsed line by line as it downloads, the file is never held in memory whole
+                    async with self.bot.web.request("GET", attachment.url, timeout=60) as response:
+                        async for line in response.content:
+                            deck.add(parser.feed(line.decode("utf-8", "replace")))
+
+            if not deck:
+                await ctx.send("I couldn't find any cards in that! Put one card per line, like `4 Lightning Bolt`")
+                return
+
+            with self.timed("value"):
+                lines = await self.valuer.value(self.categories[game], deck.entries())
+            lines.sort(key=lambda line: -line.total)
+            products = await self.bot.tcg.products({line.product_id for line in lines[:15] if line.product_id})
+
+        priced = [line for line in lines if line.price is not None]
+        embed = discord.Embed(title=f"{game} list value: ${sum(line.total for line in lines):,.2f}")
+        embed.add_field(name="Cards", value=f"{sum(line.entry.quantity for line in lines):,}")
+        embed.add_field(name="Priced", value=f"{len(priced):,}/{len(lines):,} different cards")
+        notes = []
+        if parser.bad:
+            notes.append(f"{parser.bad:,} lines I couldn't read")
+        if deck.dropped:
+            notes.append(f"{deck.dropped:,} cards past the first {deck.max_cards:,}")
+        if notes:
+            embed.add_field(name="Skipped", value=", ".join(notes))
+
+        for line in priced[:15]:
+            product = products.get(line.product_id)
+            name = product.name if product is not None else line.entry.name
+            embed.add_field(name=f"{line.entry.quantity}x {name} ({line.sub_type})", inline=False,
+                            value=f"${line.price:,.2f} each, ${line.total:,.2f}")
+        missing = [line.entry.name for line in lines if line.price is None]
+        if missing:
+            shown = ", ".join(missing[:10]) + (f" and {len(missing) - 10} more" if len(missing) > 10 else "")
+            embed.add_field(name="Not found", value=shown[:1024], inline=False)
+
+        # Everything, line by line, goes in a CSV next to the embed
+        breakdown = io.StringIO()
+        writer = csv.writer(breakdown)
+        writer.writerow(["quantity", "name", "set", "productId", "subType", "price", "total"])
+        for line in lines:
+            writer.writerow([line.entry.quantity, line.entry.name, line.entry.set_code or "", line.product_id or "",
+                             line.sub_type or "", "" if line.price is None else f"{line.price:.2f}",
+                             f"{line.total:.2f}"])
+        file = discord.File(io.BytesIO(breakdown.getvalue().encode()), filename="value.csv")
+
+        with self.timed("send"):
+            await ctx.send(embed=embed, file=file)
+
+    @commands.command()
+    async def random(self, ctx, game: str = None):
+        """View a random listing, from any game or just one. Usage `c!random` or `c!random Magic`"""
+        if game is not None:
+            if not await self.ready(ctx):
+                return
+            if game not in self.categories:
+                await ctx.send("That is not a valid game!")
+                return
+        category_id = None if game is None else self.categories[game]
+
+        async with ctx.channel.typing():
+            product_id = self.catalog.ids.random(category_id)
+            if product_id is not None:
+                card = await self.bot.tcg.product(product_id)
+            else:
+                # The catalog hasn't synced this game yet, draw from TCGPlayer's listing instead
+                if not await self.ready(ctx):
+                    return
+                card = await self.bot.tcg.random_product(category_id or random.choice(self.bot.credentials.game_ids()))
+            if card is None:
+                await ctx.send("Couldn't find a card this time, try again!")
+                return
+
+            group, prices = await asyncio.gather(self.bot.tcg.group(card.group_id),
+                                                 self.bot.tcg.prices([card.product_id]))
+            embed = self.renderer.card(card, group, prices.get(card.product_id, ()))
+
+        with self.timed("send"):
+            await ctx.send(embed=embed)
+
     @commands.command(hidden=True)
     async def ptcgo(self, ctx, *, name: str):
         """Search the value of something in terms of Guardians Rising packs. `c!info Burning Shadows`
         `c!info Golisopod GX` Very early beta, you might just check ou7c4st"""
-        emotes = "\u25c0\u25b6\u274c"
-
-        # print(self.ocarddata)
-        vname = name + " 0"
-        cards = []
-        # print(vname)
-        # print(vname in self.ocarddata), print(self.ocarddata[vname])
-        while vname in self.ocarddata:
-            cards.append(vname)
-            vname = vname[:-1] + str(int(vname[-1]) + 1)
-        cards.reverse()
-        embed = discord.Embed(title=name)
-        for fname, field in self.ocarddata[cards[0]].items():
-            field = field or "N/A"
-            embed.add_field(name=fname, value=field)
-
-        message = await ctx.send(embed=embed)
+        store = await self.ptcgo_store()
+        cards = store.lookup(name) or store.prefix(name)
+        if not cards:
+            await ctx.send("No cards found" + self.did_you_mean(await self.ptcgo_suggester(), name))
+            return
 
-        index = 0
+        async def page(index):
+            return self.renderer.ptcgo(cards[index])
 
-        for emote in emotes:
-            await message.add_reaction(emote)
+        with self.timed("send"):
+            message = await ctx.send(embed=self.renderer.ptcgo(cards[0]))
 
-        def check(r, u):
-            return r.message.id == message.id
+        await self.paginator.start(message, len(cards), page)
 
-        while True:
-            try:
-                r, u = await ctx.bot.wait_for('reaction_add', check=check, timeout=80)
-            except asyncio.TimeoutError:
-                await ctx.send("Timed out! Try again")
-                return
+    @commands.command(hidden=True)
+    async def packev(self, ctx, *, set_name: str = None):
+        """Expected value of a PTCGO pack from the cards on the price sheet, in Guardians Rising packs.
+        `c!packev Burning Shadows`, or just `c!packev` for the best sets"""
+        sheet = await self.ptcgo_analytics()
+        if set_name is None:
+            embed = discord.Embed(title="Best PTCGO packs to open [EV in Guardians Rising packs]")
+            for name, ev, cost in sheet.ranking()[:15]:
+                embed.add_field(name=name, value=f"EV {ev:.3f}" + ("" if cost is None else f", costs {cost:g}"))
+            await ctx.send(embed=embed)
+            return
 
-            # if u not in [ctx.author, ctx.bot.user] or r.emoji not in emotes:
-            if u != ctx.bot.user:
-                try:
-                    await message.remove_reaction(r.emoji, u)
-                except:
-                    pass
-            else:
-                continue
+        set_id = sheet.find_set(set_name)
+        if set_id is None:
+            await ctx.send("That set isn't on the sheet! Try one of: " + ", ".join(sheet.sets))
+            return
 
-            if r.emoji == emotes[0]:
-                if index == 0:
-                    continue
-                else:
-                    embed.clear_fields()
-                    index -= 1
-                    for emote in emotes:
-                        await message.add_reaction(emote)
-
-            elif r.emoji == emotes[1]:
-                if index == len(cards) - 1:
-                    continue
-                else:
-                    embed.clear_fields()
-                    index += 1
-                    for emote in emotes:
-                        await message.add_reaction(emote)
+        ev, shares = sheet.expected_value(set_id)
+        embed = discord.Embed(title=f"{sheet.sets[set_id]} pack EV: {ev:.3f} Guardians Rising packs")
+        pack = sheet.find_pack(set_name)
+        if pack is not None:
+            embed.add_field(name="Pack value", value=f"{sheet.pack_values[pack]:g}", inline=False)
+        for rarity, (count, share) in shares.items():
+            embed.add_field(name=rarity, value=f"{count} listed, {share:.3f}" if share else f"{count} listed, odds unknown")
+        embed.set_footer(text="Cards missing from the sheet count as worthless, pull odds are approximate")
+        await ctx.send(embed=embed)
 
-            elif r.emoji == emotes[2]:
+    @commands.command(hidden=True)
+    async def topcards(self, ctx, rarity: str, *, set_name: str = None):
+        """The most valuable PTCGO cards of a rarity. `c!topcards "Full Art"`, `c!topcards Rare Guardians Rising`"""
+        sheet = await self.ptcgo_analytics()
+        rarity_id = sheet.find_rarity(rarity)
+        if rarity_id is None:
+            await ctx.send("Unknown rarity! Try one of: " + ", ".join(sheet.rarities))
+            return
+        set_id = None
+        if set_name is not None:
+            set_id = sheet.find_set(set_name)
+            if set_id is None:
+                await ctx.send("That set isn't on the sheet! Try one of: " + ", ".join(sheet.sets))
                 return
 
-            for fname, field in self.ocarddata[cards[index]].items():
-                field = field or "N/A"
-                embed.add_field(name=fname, value=field)
+        cards = sheet.top(rarity_id, 15, set_id)
+        if not cards:
+            await ctx.send("No cards found")
+            return
+        title = f"Most valuable {sheet.rarities[rarity_id]} cards" + (f" in {sheet.sets[set_id]}" if set_name else "")
+        embed = discord.Embed(title=title)
+        for name, card_set, price in cards:
+            embed.add_field(name=name, value=f"{price:g} GRI packs" + (f" ({card_set})" if card_set else ""))
+        await ctx.send(embed=embed)
 
-            await message.edit(embed=embed)
+    @commands.command(hidden=True)
+    async def packs(self, ctx, *, query: str):
+        """What a PTCGO card or pack is worth in packs. `c!packs Tapu Lele GX`, `c!packs Tapu Lele GX in Burning Shadows`"""
+        sheet = await self.ptcgo_analytics()
+        name, _, pack_name = query.rpartition(" in ")
+        pack_id = None if not name else sheet.find_pack(pack_name)
+        if pack_id is None:
+            name = query
+
+        values = sheet.conversions(name, pack_id)
+        if not values:
+            await ctx.send("No cards found")
+            return
+        embed = discord.Embed(title=name)
+        for rarity, value, converted in values:
+            text = f"{value:g} Guardians Rising packs"
+            if pack_id is not None:
+                text += f"\n{converted:.2f} {sheet.packs[pack_id]} packs"
+            embed.add_field(name=rarity, value=text)
+        await ctx.send(embed=embed)
 
 
 class Administration(commands.Cog):
@@ -564,9 +983,19 @@ class Administration(commands.Cog):
         # b = monotonic()
         # ping = "{:.3f}ms".format((b - a) * 1000)
 
+        import psutil
         embed.add_field(name="CPU Percentage", value="{}%".format(psutil.cpu_percent()))
         embed.add_field(name="Memory Usage", value=self.bot.get_ram())
         embed.add_field(name="Observed Events", value=sum(self.bot.socket_stats.values()))
+        embed.add_field(name="HTTP Pool", value="{active} active, {idle} idle of {limit}, {failures}/{requests} failed".format(
+            **self.bot.web.pool_stats()))
+        scheduler = self.bot.web.scheduler.stats()
+        embed.add_field(name="TCGPlayer Queue", value="{} queued, {:.1f} req/s, p95 wait {:.0f}ms".format(
+            sum(scheduler["queued"].values()), scheduler["rate"], scheduler["wait"]["interactive"]["p95"] * 1000))
+        embed.add_field(name="Cache", value="\n".join(
+            "{}: {:.0%} hits ({}/{} entries)".format(name, stats["hit_rate"], stats["size"], cache.maxsize)
+            for name, cache in self.bot.caches.items() for stats in (cache.stats(),)
+        ), inline=False)
         # embed.add_field(name=await _(ctx, "Ping"), value=ping)
 
         embed.add_field(name="Source", value="[Github](https://github.com/henry232323/CardBuddy)")
@@ -575,6 +1004,39 @@ class Administration(commands.Cog):
         embed.set_thumbnail(url=self.bot.user.avatar_url)
         await ctx.send(delete_after=60, embed=embed)
 
+    @commands.is_owner()
+    @commands.command(hidden=True)
+    async def perf(self, ctx, metric: str = None):
+        """Latency percentiles over the last 5 minutes. `c!perf` or `c!perf upstream`"""
+        lines = [f"{'metric':<8} {'labels':<44} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"]
+        for (name, labels), histogram in sorted(self.bot.metrics.histograms.items()):
+            if metric is not None and name != metric:
+                continue
+            stats = histogram.snapshot()
+            if not stats["count"]:
+                continue
+            labels = " ".join(value for _, value in labels)
+            lines.append(f"{name:<8} {labels[:44]:<44} {stats['count']:>6}" + "".join(
+                f" {stats[q] * 1000:>6.1f}ms" for q in ("p50", "p95", "p99", "max")))
+
+        if metric is None:
+            lines.append("")
+            for stage, seconds in self.bot.startup.items():
+                lines.append(f"startup  {stage:<44} {seconds:>6.2f}s after launch")
+            for name, cache in self.bot.caches.items():
+                stats = cache.stats()
+                lines.append(f"cache    {name:<44} {stats['hits']:>6} hits {stats['misses']} misses "
+                             f"{stats['coalesced']} coalesced ({stats['hit_rate']:.0%})")
+
+        # Split on lines to stay under the message length limit
+        chunk = ""
+        for line in lines:
+            if len(chunk) + len(line) > 1900:
+                await ctx.send(f"```\n{chunk}```")
+                chunk = ""
+            chunk += line + "\n"
+        await ctx.send(f"```\n{chunk}```")
+
     @commands.command(hidden=True)
     async def totalcmds(self, ctx):
         """Get totals of commands and their number of uses"""
@@ -633,5 +1095,6 @@ class Administration(commands.Cog):
                        "Or subscribe to my Patreon here: https://www.patreon.com/henry232323")
 
 
-bot = Bot()
-bot.run(auth[0])
+if __name__ == "__main__":
+    bot = Bot()
+    bot.run(bot.auth[0])
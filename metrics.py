@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import math
+import time
+import asyncio
+from array import array
+from time import perf_counter
+from aiohttp import web
+from contextlib import contextmanager, nullcontext
+
+# Bucket i holds samples up to BASE * GROWTH ** i seconds, the last one everything slower
+BASE = 50e-6
+GROWTH = 1.25
+BUCKETS = 68
+BOUNDS = tuple(BASE * GROWTH ** i for i in range(BUCKETS - 1)) + (math.inf,)
+
+_IDS = re.compile(r"\d+(,\d+)*")
+
+
+def timer(metrics, name, **labels):
+    """metrics.timer(name, **labels), or nothing for parts running without metrics"""
+    return nullcontext() if metrics is None else metrics.timer(name, **labels)
+
+
+def endpoint(method, path):
+    """A request's route with ids left out, so every product lookup is one series"""
+    return f"{method} {_IDS.sub('{id}', path.split('?', 1)[0])}"
+
+
+class Histogram:
+    """Latency histogram over the last `window` seconds in fixed memory.
+
+    Samples go into log-spaced buckets (25% apart) in one of `slots` rotating
+    time slices, so percentiles only ever count recent samples and are off
+    by at most a bucket's width. Count and sum also cover the whole run."""
+
+    def __init__(self, window=300, slots=10):
+        self.slot_length = window / slots
+        self._buckets = [array('L', [0]) * BUCKETS for _ in range(slots)]
+        self._epochs = [-1] * slots
+        self._max = [0.0] * slots
+
+        self.count = 0
+        self.sum = 0.0
+
+    def _slot(self, epoch):
+        i = epoch % len(self._buckets)
+        if self._epochs[i] != epoch:
+            self._epochs[i] = epoch
+            self._buckets[i] = array('L', [0]) * BUCKETS
+            self._max[i] = 0.0
+        return i
+
+    def observe(self, seconds):
+        i = self._slot(int(time.monotonic() / self.slot_length))
+        bucket = 0 if seconds <= BASE else min(BUCKETS - 1, math.ceil(math.log(seconds / BASE, GROWTH)))
+        self._buckets[i][bucket] += 1
+        self._max[i] = max(self._max[i], seconds)
+        self.count += 1
+        self.sum += seconds
+
+    def _recent(self):
+        oldest = int(time.monotonic() / self.slot_length) - len(self._buckets) + 1
+        return [i for i, epoch in enumerate(self._epochs) if epoch >= oldest]
+
+    def snapshot(self, quantiles=(0.5, 0.95, 0.99)):
+        """Count, max and the given quantiles in seconds over the window"""
+        recent = self._recent()
+        counts = [sum(self._buckets[i][b] for i in recent) for b in range(BUCKETS)]
+        total = sum(counts)
+        peak = max((self._max[i] for i in recent), default=0.0)
+
+        result = {"count": total, "max": peak}
+        for q in quantiles:
+            rank, seen = q * total, 0
+            for bucket, n in enumerate(counts):
+                seen += n
+                if n and seen >= rank:
+                    result[f"p{q * 100:g}"] = min(BOUNDS[bucket], peak)
+                    break
+            else:
+                result[f"p{q * 100:g}"] = 0.0
+        return result
+
+
+class Metrics:
+    """Named latency histograms and counters, each split by labels.
+
+    Gauges are read from callbacks when a report is made, so things that
+    already keep their own numbers (caches, the HTTP pool) aren't copied."""
+
+    def __init__(self, prefix="cardbuddy", window=300):
+        self.prefix = prefix
+        self.window = window
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.window)
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, read, label):
+        """read() returns {label value: {field: number}}, reported as name_field{label=...}"""
+        self.gauges[name] = (read, label)
+
+    def _gauges(self):
+        for name, (read, label) in self.gauges.items():
+            for value, fields in read().items():
+                for field, number in fields.items():
+                    if isinstance(number, (int, float)):
+                        yield f"{name}_{field}", ((label, str(value)),), number
+
+    def to_json(self):
+        return {
+            "histograms": [
+                {"name": name, "labels": dict(labels), "total": h.count, "sum": h.sum, **h.snapshot()}
+                for (name, labels), h in sorted(self.histograms.items())
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+            "gauges": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for name, labels, value in self._gauges()
+            ],
+        }
+
+    def to_prometheus(self):
+        """Prometheus text format: histograms as summaries over the window"""
+        def series(name, labels, extra=()):
+            labels = ",".join(f'{k}="{v}"' for k, v in (*labels, *extra))
+            return f"{self.prefix}_{name}{{{labels}}}" if labels else f"{self.prefix}_{name}"
+
+        lines, typed = [], set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        for (name, labels), h in sorted(self.histograms.items()):
+            declare(f"{name}_seconds", "summary")
+            snapshot = h.snapshot()
+            for q in ("0.5", "0.95", "0.99"):
+                value = snapshot[f"p{float(q) * 100:g}"]
+                lines.append(f"{series(f'{name}_seconds', labels, [('quantile', q)])} {value:.6f}")
+            lines.append(f"{series(f'{name}_seconds_sum', labels)} {h.sum:.6f}")
+            lines.append(f"{series(f'{name}_seconds_count', labels)} {h.count}")
+        for (name, labels), value in sorted(self.counters.items()):
+            declare(f"{name}_total", "counter")
+            lines.append(f"{series(f'{name}_total', labels)} {value}")
+        for name, labels, value in self._gauges():
+            declare(name, "gauge")
+            lines.append(f"{series(name, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the metrics to path, as Prometheus text for .prom files and JSON otherwise"""
+        text = self.to_prometheus() if path.endswith(".prom") else json.dumps(self.to_json())
+        tmp = path + ".tmp"
+        with open(tmp, 'w') as fd:
+            fd.write(text)
+        os.replace(tmp, path)
+
+    async def run_dump(self, path, interval=15):
+        while True:
+            self.dump(path)
+            await asyncio.sleep(interval)
+
+    async def serve(self, host="127.0.0.1", port=9110):
+        """Serve the metrics on http://host:port/metrics for a Prometheus scraper"""
+        async def handler(request):
+            if request.query.get("format") == "json":
+                return web.json_response(self.to_json())
+            return web.Response(text=self.to_prometheus(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
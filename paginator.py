@@ -0,0 +1,174 @@
+import asyncio
+import discord
+from collections import OrderedDict
+from traceback import print_exc
+
+from metrics import timer
+from timerwheel import TimerWheel
+
+PREVIOUS, NEXT, CLOSE = "◀", "▶", "❌"
+EMOTES = (PREVIOUS, NEXT, CLOSE)
+
+
+class Session:
+    """One paginated message: which page it shows, which one was asked for last and how to build the others"""
+
+    def __init__(self, message, total, page, on_close=None):
+        self.message = message
+        self.total = total
+        self.page = page
+        self.on_close = on_close
+        self.index = 0
+        self.shown = 0
+        self.dirty = False
+        self.editing = False
+        self.timer = None
+        self.reacting = None
+        self.closed = asyncio.Event()
+        self.removable = can_remove_reactions(message)
+
+
+def can_remove_reactions(message):
+    """Whether the bot may take other users' reactions off message, which needs Manage Messages in a guild"""
+    guild = getattr(message, "guild", None)
+    if guild is None:
+        return False
+    return message.channel.permissions_for(guild.me).manage_messages
+
+
+class Paginator:
+    """Reaction pagination for every open message, fed by one raw reaction listener.
+
+    Sessions are looked up by message id, so a reaction costs the same no
+    matter how many paginators are open. At most `max_sessions` stay open,
+    the least recently used is dropped first, and idle sessions time out
+    after `timeout` seconds on a shared timer wheel.
+
+    Discord calls are kept to what a page turn needs. The emotes are added
+    once, in the background, and not at all to single page messages. Each
+    click takes the user's reaction off while the page is edited. Where the
+    bot can't remove reactions (DMs, no Manage Messages) it doesn't try,
+    and taking a reaction off counts as a click instead. A message has one
+    edit in flight at a time; clicks that arrive meanwhile only move the
+    page asked for, so a burst of them ends in a single edit to the last
+    page."""
+
+    def __init__(self, bot, max_sessions=1000, timeout=80, wheel=None, metrics=None):
+        self.bot = bot
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.wheel = TimerWheel() if wheel is None else wheel
+        self.metrics = metrics
+        self.sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    async def start(self, message, total, page, on_close=None):
+        """Make message flip through total pages, page(index) being an async function returning an Embed"""
+        if total <= 1:
+            if on_close is not None:
+                on_close()
+            return None
+
+        session = Session(message, total, page, on_close)
+        self.sessions[message.id] = session
+        while len(self.sessions) > self.max_sessions:
+            self.close(next(iter(self.sessions.values())))
+        self._touch(session)
+        session.reacting = asyncio.ensure_future(self._react(session))
+        return session
+
+    async def _react(self, session):
+        # One at a time, so they show up in order
+        with timer(self.metrics, "stage", stage="react"):
+            for emote in EMOTES:
+                if session.closed.is_set():
+                    return
+                try:
+                    await session.message.add_reaction(emote)
+                except discord.HTTPException:
+                    return
+
+    async def refresh(self, session, total):
+        """Give session a new page count, editing the page on show so it says so"""
+        session.total = total
+        session.dirty = True
+        await self._show(session)
+
+    def _touch(self, session):
+        if session.timer is not None:
+            session.timer.cancel()
+        session.timer = self.wheel.schedule(self.timeout, self._expire, session)
+        self.sessions.move_to_end(session.message.id)
+
+    def close(self, session):
+        if self.sessions.pop(session.message.id, None) is None:
+            return
+        session.timer.cancel()
+        if session.reacting is not None:
+            session.reacting.cancel()
+        if session.on_close is not None:
+            session.on_close()
+        session.closed.set()
+
+    async def _expire(self, session):
+        if self.sessions.get(session.message.id) is session:
+            self.close(session)
+            await session.message.channel.send("Timed out! Try again")
+
+    async def dispatch(self, payload, removed=False):
+        """Handle a raw reaction add, or a removal where the bot can't remove reactions itself"""
+        session = self.sessions.get(payload.message_id)
+        if session is None or payload.user_id == self.bot.user.id or (removed and session.removable):
+            return
+
+        emoji = str(payload.emoji)
+        if emoji == CLOSE:
+            self.close(session)
+            return
+
+        if emoji == PREVIOUS:
+            step = -1
+        elif emoji == NEXT:
+            step = 1
+        else:
+            return
+
+        self._touch(session)
+        session.index = min(max(session.index + step, 0), session.total - 1)
+        if session.removable and not removed:
+            await asyncio.gather(self._unreact(session, emoji, payload.user_id), self._show(session))
+        else:
+            await self._show(session)
+
+    @staticmethod
+    async def _unreact(session, emoji, user_id):
+        try:
+            await session.message.remove_reaction(emoji, discord.Object(user_id))
+        except discord.HTTPException:
+            pass
+
+    async def _show(self, session):
+        """Edit the message until it shows the last page asked for, unless another call already is.
+
+        A refresh while an edit is in flight marks the session dirty, so the
+        loop goes round again to draw the new page count."""
+        if session.editing:
+            return
+        session.editing = True
+        try:
+            while (session.dirty or session.shown != session.index) and not session.closed.is_set():
+                index = session.index
+                session.dirty = False
+                embed = await session.page(index)
+                with timer(self.metrics, "stage", stage="edit"):
+                    await session.message.edit(embed=embed)
+                session.shown = index
+        except discord.HTTPException:
+            pass
+        except Exception:
+            # Building the page failed, the next click tries again
+            print_exc()
+        finally:
+            session.editing = False
@@ -0,0 +1,114 @@
+import os
+import re
+import json
+import sqlite3
+from collections import namedtuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    position INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    variant INTEGER NOT NULL,
+    rarity TEXT,
+    price REAL,
+    fields TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cards_key ON cards (key, variant);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+Card = namedtuple("Card", "position name variant rarity price fields")
+
+# The sheet was scraped with zero width spaces in it, some of them mis-decoded
+_JUNK = re.compile("\u200b|\u00e2\u20ac\u2039")
+_SPACE = re.compile(r"\s+")
+
+
+def clean(value):
+    return _SPACE.sub(" ", _JUNK.sub("", value)).strip()
+
+
+def normalize(name):
+    return clean(name).casefold()
+
+
+def parse_price(fields):
+    """The first field that holds a number, since the sheet names its price column a dozen ways"""
+    for value in fields.values():
+        try:
+            return float(clean(value))
+        except ValueError:
+            continue
+    return None
+
+
+class PTCGOStore:
+    """The PTCGO trade price sheet from files.json, compiled into SQLite.
+
+    files.json keys look like "Name 0", "Name 1", one per variant. They are
+    split into a normalized name and a variant number so that every variant
+    of a card is one indexed lookup. The database is only rebuilt when
+    files.json changes."""
+
+    def __init__(self, path="ptcgo.db", source="files.json"):
+        self.path = path
+        self.source = source
+        # Built in an executor thread, then only used from the event loop
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        if self._stamp() != self._meta("source"):
+            self.compile()
+
+    def _stamp(self):
+        stat = os.stat(self.source)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+    def compile(self):
+        with open(self.source, 'r') as fd:
+            data = json.load(fd)
+
+        rows = []
+        for position, (key, fields) in enumerate(data.items()):
+            name, _, variant = key.rpartition(" ")
+            rows.append((position, clean(name), normalize(name), int(variant),
+                         clean(fields.get("Rarity", "")) or None, parse_price(fields), json.dumps(fields)))
+
+        with self.db:
+            self.db.execute("DELETE FROM cards")
+            self.db.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (self._stamp(),))
+
+    def _cards(self, query, *args):
+        return [Card(position, name, variant, rarity, price, json.loads(fields))
+                for position, name, variant, rarity, price, fields in self.db.execute(query, args)]
+
+    def lookup(self, name):
+        """Every variant of a card, case insensitively, newest variant first"""
+        return self._cards(
+            "SELECT position, name, variant, rarity, price, fields FROM cards "
+            "WHERE key = ? ORDER BY variant DESC", normalize(name)
+        )
+
+    def prefix(self, name, limit=25):
+        """Variants of the cards whose name starts with name"""
+        key = normalize(name)
+        return self._cards(
+            "SELECT position, name, variant, rarity, price, fields FROM cards "
+            "WHERE key >= ? AND key < ? ORDER BY key, variant DESC LIMIT ?", key, key + "\uffff", limit
+        )
+
+    def names(self):
+        return [row[0] for row in self.db.execute("SELECT DISTINCT name FROM cards WHERE name != ''")]
+
+    def rows(self):
+        """(name, fields JSON) for every row in sheet order, set headers included"""
+        return self.db.execute("SELECT name, fields FROM cards ORDER BY position").fetchall()
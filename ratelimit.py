@@ -0,0 +1,143 @@
+import asyncio
+from time import monotonic
+from heapq import heappush, heappop
+from itertools import count
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+# Lanes, lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+LANES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+def retry_after(response, default=5.0):
+    """Seconds a 429 response asks us to wait, or default if it doesn't say"""
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return default
+
+
+class RequestScheduler:
+    """Token bucket in front of the TCGPlayer API with priority lanes.
+
+    Requests wait in a heap ordered by lane, then arrival, and are let out
+    at most `rate` per second (bursting up to `burst`) with at most
+    `concurrency` in flight. A 429 pauses every lane for its Retry-After
+    and halves the rate, which then creeps back up with each success."""
+
+    MIN_RATE = 0.5
+    RECOVERY = 0.05
+
+    def __init__(self, rate=5.0, burst=10, concurrency=16):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        self.active = 0
+
+        self._queue = []
+        self._order = count()
+        self._dispatcher = None
+        self._freed = asyncio.Event()
+
+        self.admitted = Counter()
+        self.throttled = 0
+        self.waits = {lane: deque(maxlen=1000) for lane in LANES}
+
+    def queue_depth(self):
+        return Counter(LANES[entry[0]] for entry in self._queue)
+
+    def busy(self):
+        """Whether commands are waiting for the bucket, or a 429 has slowed it down"""
+        return self.rate < self.max_rate or any(entry[0] == INTERACTIVE for entry in self._queue)
+
+    def stats(self):
+        waits = {}
+        for lane, samples in self.waits.items():
+            ordered = sorted(samples)
+            waits[LANES[lane]] = {
+                "p50": ordered[len(ordered) // 2] if ordered else 0.0,
+                "p95": ordered[int(len(ordered) * 0.95)] if ordered else 0.0,
+            }
+        return {
+            "rate": self.rate,
+            "active": self.active,
+            "queued": dict(self.queue_depth()),
+            "admitted": {LANES[lane]: n for lane, n in self.admitted.items()},
+            "throttled": self.throttled,
+            "wait": waits,
+        }
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def _dispatch(self):
+        try:
+            while self._queue:
+                now = monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens < 1:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                    continue
+
+                if self.active >= self.concurrency:
+                    self._freed.clear()
+                    await self._freed.wait()
+                    continue
+
+                lane, _, queued, future = heappop(self._queue)
+                if future.done():
+                    continue
+                self.tokens -= 1
+                self.active += 1
+                self.admitted[lane] += 1
+                self.waits[lane].append(now - queued)
+                future.set_result(None)
+        finally:
+            self._dispatcher = None
+
+    async def acquire(self, lane=INTERACTIVE):
+        future = asyncio.get_event_loop().create_future()
+        heappush(self._queue, (lane, next(self._order), monotonic(), future))
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._freed.set()
+
+    @asynccontextmanager
+    async def slot(self, lane=INTERACTIVE):
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def success(self):
+        self.rate = min(self.max_rate, self.rate + self.RECOVERY)
+
+    def throttle(self, delay):
+        """Back off after a 429: stop everything for delay seconds and halve the rate"""
+        self.throttled += 1
+        self.rate = max(self.MIN_RATE, self.rate / 2)
+        self.tokens = min(self.tokens, 0)
+        self.paused_until = max(self.paused_until, monotonic() + delay)
@@ -0,0 +1,61 @@
+import discord
+
+from metrics import timer
+
+
+class Renderer:
+    """Card embeds, built once per card and prices and shared by every command, user and guild.
+
+    Payloads are cached as Embed dicts keyed on (productId, set, prices), so
+    a price change is a new entry rather than an invalidation. Page
+    positions aren't part of the payload; they're set on the fresh Embed
+    wrapped around it for each send. Embeds from here share their fields
+    with the cache, so callers only set the title and never add fields."""
+
+    def __init__(self, cache, affiliate="", metrics=None):
+        self.cache = cache
+        self.affiliate = affiliate
+        self.metrics = metrics
+
+    def _payload(self, key, build):
+        payload = self.cache.get(key)
+        if payload is None:
+            with timer(self.metrics, "stage", stage="render"):
+                payload = build().to_dict()
+            self.cache.set(key, payload)
+        return payload
+
+    def card(self, card, group=None, prices=(), index=None, total=None):
+        """The embed for a TCGPlayer product, titled as item index of total when paginated"""
+        key = ("card", card.product_id, None if group is None else group.group_id, prices)
+        embed = discord.Embed.from_dict(self._payload(key, lambda: self._card(card, group, prices)))
+        if total is not None:
+            embed.title = f"{card.name} [Item {index + 1}/{total}]"
+        return embed
+
+    def _card(self, card, group, prices):
+        embed = discord.Embed(title=card.name, url=card.url + self.affiliate)
+        embed.set_image(url=card.image_url)
+        if group is not None:
+            embed.add_field(name="Pack", value=group.name)
+            embed.add_field(name="Type", value=group.abbreviation)
+        for item in card.extended_data:
+            embed.add_field(name=item.display_name, value=item.value)
+
+        for price in prices:
+            if price.market is not None:
+                embed.add_field(name=f"Market ({price.sub_type_name})", value=f"${price.market}")
+
+        embed.set_footer(text=f"Product ID {card.product_id}, c!watch {card.product_id} <price> for price alerts")
+        return embed
+
+    def ptcgo(self, card):
+        """The embed for a PTCGO card"""
+        return discord.Embed.from_dict(self._payload(("ptcgo", card.position), lambda: self._ptcgo(card)))
+
+    @staticmethod
+    def _ptcgo(card):
+        embed = discord.Embed(title=card.name)
+        for name, value in card.fields.items():
+            embed.add_field(name=name, value=value or "N/A")
+        return embed
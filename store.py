@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+
+# Ids per IN (...) query, staying under SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+def connect(path, schema, synchronous="NORMAL"):
+    """A connection to the database at path with schema created, in WAL mode so the bot's
+    processes can read while one of them writes"""
+    db = sqlite3.connect(path, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(f"PRAGMA synchronous={synchronous}")
+    db.executescript(schema)
+    return db
+
+
+def select_in(db, sql, ids, *params):
+    """Rows of sql for every one of ids, a chunk at a time.
+
+    {ids} in sql stands for the chunk's placeholders, which are bound after params."""
+    ids = list(ids)
+    for i in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[i:i + CHUNK_SIZE]
+        yield from db.execute(sql.format(ids=",".join("?" * len(chunk))), (*params, *chunk))
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+
+class SharedStore:
+    """Pickled values with expiry times, shared by the bot's processes through SQLite in WAL mode.
+
+    Keys are anything with a stable repr. Reads never block on a writer, and
+    `claim` lets exactly one process at a time take on a periodic job."""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path="shared.db", owner=None):
+        self.path = path
+        self.owner = str(os.getpid() if owner is None else owner)
+        self.db = connect(path, SCHEMA)
+        self._writes = 0
+
+    def get(self, namespace, key, default=None):
+        row = self.db.execute("SELECT value FROM entries WHERE namespace = ? AND key = ? AND expires > ?",
+                              (namespace, repr(key), time.time())).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, namespace, keys):
+        """{key: (value, seconds left)} for the keys that are stored and not expired"""
+        keys = {repr(key): key for key in keys}
+        now = time.time()
+        rows = select_in(self.db, "SELECT key, value, expires FROM entries WHERE namespace = ? AND expires > ? "
+                                  "AND key IN ({ids})", keys, namespace, now)
+        return {keys[name]: (pickle.loads(value), expires - now) for name, value, expires in rows}
+
+    def items(self, namespace):
+        return {name: pickle.loads(value) for name, value in self.db.execute(
+            "SELECT key, value FROM entries WHERE namespace = ? AND expires > ?", (namespace, time.time()))}
+
+    def set(self, namespace, key, value, ttl):
+        self.set_many(namespace, {key: value}, ttl)
+
+    def set_many(self, namespace, items, ttl):
+        if not items:
+            return
+        expires = time.time() + ttl
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                ((namespace, repr(key), pickle.dumps(value), expires) for key, value in items.items())
+            )
+
+        self._writes += len(items)
+        if self._writes >= self.PURGE_EVERY:
+            self.purge()
+
+    def delete(self, namespace, key):
+        with self.db:
+            self.db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, repr(key)))
+
+    def purge(self):
+        self._writes = 0
+        with self.db:
+            self.db.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+
+    def claim(self, name, period):
+        """Whether this process gets to do the job called name, at most once per period across processes"""
+        now = time.time()
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO entries VALUES ('claims', ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+                "WHERE entries.expires <= ?",
+                (repr(name), pickle.dumps(self.owner), now + period, now)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, name):
+        """Give up a claim early so the next process can take the job straight away"""
+        with self.db:
+            self.db.execute("DELETE FROM entries WHERE namespace = 'claims' AND key = ? AND value = ?",
+                            (repr(name), pickle.dumps(self.owner)))
+
+
+RESPONSES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+"""
+
+
+class ResponseStore:
+    """TCGPlayer JSON for catalog entities that rarely change, kept on disk with when it was fetched.
+
+    Entries never expire here; whoever reads one decides from its age
+    whether it needs revalidating."""
+
+    def __init__(self, path="responses.db", max_age=24 * 60 * 60):
+        self.max_age = max_age
+        self.db = connect(path, RESPONSES_SCHEMA)
+
+    def get_many(self, kind, ids):
+        """{id: (data, age in seconds)} for the ids that are stored"""
+        now = time.time()
+        rows = select_in(self.db, "SELECT id, data, fetched FROM responses WHERE kind = ? AND id IN ({ids})", ids, kind)
+        return {id: (json.loads(data), now - fetched) for id, data, fetched in rows}
+
+    def put_many(self, kind, items):
+        now = time.time()
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                ((kind, id, json.dumps(data), now) for id, data in items.items()))
+
+    def stats(self):
+        return {kind: {"entries": n, "oldest": time.time() - oldest}
+                for kind, n, oldest in self.db.execute("SELECT kind, COUNT(*), MIN(fetched) FROM responses GROUP BY kind")}
@@ -0,0 +1,130 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from catalog import normalize
+
+
+def deletions(word):
+    """word with each one of its letters left out"""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class Suggester:
+    """Card names for "did you mean" replies and completions.
+
+    Distinct names are kept sorted by their normalized form, so completions
+    are a bisect into the list. Misspellings are corrected a word at a time:
+    every vocabulary word is indexed under itself with each letter left out,
+    so the words about one typo away from a query word are a handful of dict
+    lookups. The names containing the corrected words, starting with the
+    query word that appears in the fewest names, are then scored on how many
+    of the query's words they match."""
+
+    MIN_FUZZY = 4  # Shorter words ("gx", "ex", "of") only match exactly
+    CANDIDATES = 64
+    MAX_POSTINGS = 2000
+
+    def __init__(self, names):
+        by_key = {}
+        for name in names:
+            key = normalize(name)
+            if key:
+                by_key.setdefault(key, name)
+
+        self.keys = sorted(by_key)
+        self.names = [by_key[key] for key in self.keys]
+        postings = defaultdict(lambda: array('I'))
+        for i, key in enumerate(self.keys):
+            for word in set(key.split()):
+                postings[word].append(i)
+        self.words = dict(postings)
+
+        self.deletes = defaultdict(list)
+        for word in self.words:
+            if len(word) >= self.MIN_FUZZY:
+                for variant in deletions(word):
+                    self.deletes[variant].append(word)
+        self.deletes = dict(self.deletes)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def by_category(cls, rows):
+        """{categoryId: Suggester} from (productId, categoryId, name) rows"""
+        names = defaultdict(list)
+        for _, category_id, name in rows:
+            names[category_id].append(name)
+        return {category_id: cls(category_names) for category_id, category_names in names.items()}
+
+    def complete(self, text, limit=10):
+        """Names starting with text, shortest first"""
+        key = normalize(text)
+        if not key:
+            return []
+        # Normalized names are only letters, digits and spaces, so every one starting with key sorts before key + "~"
+        start = bisect_left(self.keys, key)
+        end = min(bisect_left(self.keys, key + "~", start), start + 500)
+        return [self.names[i] for i in heapq.nsmallest(limit, range(start, end), key=lambda i: len(self.keys[i]))]
+
+    def corrections(self, word):
+        """{word: 0} for a known word, otherwise {vocabulary word: 1} for those about one typo away"""
+        if word in self.words:
+            return {word: 0}
+        found = {}
+        if len(word) < self.MIN_FUZZY:
+            return found
+        # Deleting from the query covers an extra letter, deleting from the vocabulary a missing one, both a wrong one
+        for variant in deletions(word) | {word}:
+            if variant in self.words:
+                found.setdefault(variant, 1)
+            for known in self.deletes.get(variant, ()):
+                found.setdefault(known, 1)
+        return found
+
+    def similar(self, text, limit=5):
+        """The names closest to text, best first"""
+        corrections = [found for found in map(self.corrections, normalize(text).split()) if found]
+        if not corrections:
+            return []
+
+        # Candidates contain a correction of the rarest query word, narrowed down by the next rarest
+        # while there are too many. When even the rarest is in thousands of names ("gx", "of"),
+        # nothing in the query tells them apart, so there is nothing worth suggesting
+        counts = [sum(len(self.words[word]) for word in found) for found in corrections]
+        order = [found for _, found in sorted(zip(counts, corrections), key=lambda pair: pair[0])]
+        if min(counts) > self.MAX_POSTINGS:
+            return []
+        candidates = set()
+        for word in order[0]:
+            candidates.update(self.words[word])
+        for found in order[1:]:
+            if len(candidates) <= self.CANDIDATES:
+                break
+            narrowed = set().union(*(candidates.intersection(self.words[word]) for word in found))
+            if narrowed:
+                candidates = narrowed
+        # Whatever is left matches the same words, the shortest names are the closest
+        if len(candidates) > self.CANDIDATES:
+            candidates = heapq.nsmallest(self.CANDIDATES, candidates, key=lambda i: len(self.keys[i]))
+
+        scored = []
+        for i in candidates:
+            words = set(self.keys[i].split())
+            matched = 0
+            for found in corrections:
+                common = found.keys() & words
+                if common:
+                    matched += 1 - 0.25 * min(map(found.get, common))
+            scored.append((-matched, len(words) - matched, len(self.keys[i]), i))
+        scored.sort()
+        return [self.names[i] for *_, i in scored[:limit]]
+
+    def suggest(self, text, limit=5):
+        """Completions of text, then the names closest to it"""
+        found = dict.fromkeys(self.complete(text, limit))
+        if len(found) < limit:
+            found.update(dict.fromkeys(self.similar(text, limit)))
+        return list(found)[:limit]
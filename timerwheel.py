@@ -0,0 +1,78 @@
+import math
+import asyncio
+from traceback import print_exc
+
+
+class Timer:
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Hashed timer wheel, one sleeping task for any number of timeouts.
+
+    Timers land in slot deadline % slots and fire on the tick that reaches
+    their deadline, at most `resolution` seconds late. Scheduling and
+    cancelling are O(1); cancelled timers are dropped when their slot comes
+    round. Callbacks returning a coroutine are run as tasks."""
+
+    def __init__(self, resolution=1.0, slots=256):
+        self.resolution = resolution
+        self._slots = [[] for _ in range(slots)]
+        self._tick = 0
+        self._count = 0
+        self._task = None
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, delay, callback, *args):
+        ticks = max(1, math.ceil(delay / self.resolution))
+        timer = Timer(self._tick + ticks, callback, args)
+        self._slots[timer.deadline % len(self._slots)].append(timer)
+        self._count += 1
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return timer
+
+    def _advance(self):
+        self._tick += 1
+        index = self._tick % len(self._slots)
+        due, waiting = [], []
+        for timer in self._slots[index]:
+            (due if timer.cancelled or timer.deadline <= self._tick else waiting).append(timer)
+        self._slots[index] = waiting
+        self._count -= len(due)
+
+        for timer in due:
+            if timer.cancelled:
+                continue
+            try:
+                result = timer.callback(*timer.args)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            except Exception:
+                print_exc()
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        # Ticks are counted from when the wheel started turning so sleeps don't drift
+        origin = loop.time() - self._tick * self.resolution
+        try:
+            while self._count:
+                await asyncio.sleep(max(0.0, origin + (self._tick + 1) * self.resolution - loop.time()))
+                self._advance()
+        finally:
+            self._task = None
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
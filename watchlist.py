@@ -0,0 +1,207 @@
+import time
+from time import perf_counter
+from dataclasses import dataclass
+from collections import defaultdict
+from traceback import print_exc
+
+from metrics import timer
+from store import connect, select_in
+from timerwheel import TimerWheel
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watches (
+    watchId INTEGER PRIMARY KEY,
+    userId INTEGER NOT NULL,
+    channelId INTEGER,
+    productId INTEGER NOT NULL,
+    subType TEXT,
+    threshold REAL NOT NULL,
+    triggered INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS watches_product ON watches (productId);
+CREATE INDEX IF NOT EXISTS watches_user ON watches (userId);
+"""
+
+
+@dataclass(slots=True, frozen=True)
+class Watch:
+    watch_id: int
+    user_id: int
+    channel_id: int  # None to DM the user
+    product_id: int
+    sub_type: str  # None for whichever sub type is cheapest
+    threshold: float
+    triggered: bool
+
+
+@dataclass(slots=True, frozen=True)
+class Alert:
+    watch: Watch
+    sub_type: str
+    price: float
+
+
+class WatchStore:
+    """Users' price watches, on disk so every process sees the same ones"""
+
+    def __init__(self, path="watchlist.db"):
+        self.db = connect(path, SCHEMA, synchronous="FULL")
+
+    def add(self, user_id, channel_id, product_id, threshold, sub_type=None):
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO watches (userId, channelId, productId, subType, threshold, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (user_id, channel_id, product_id, sub_type, threshold, time.time())
+            )
+        return cursor.lastrowid
+
+    def remove(self, user_id, watch_id):
+        with self.db:
+            cursor = self.db.execute("DELETE FROM watches WHERE watchId = ? AND userId = ?", (watch_id, user_id))
+        return cursor.rowcount > 0
+
+    def user(self, user_id):
+        return [Watch(*row) for row in self.db.execute(
+            "SELECT watchId, userId, channelId, productId, subType, threshold, triggered FROM watches "
+            "WHERE userId = ? ORDER BY watchId", (user_id,)
+        )]
+
+    def count(self, user_id):
+        return self.db.execute("SELECT COUNT(*) FROM watches WHERE userId = ?", (user_id,)).fetchone()[0]
+
+    def products_after(self, product_id, limit):
+        """Up to limit distinct watched product ids greater than product_id, in order"""
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT productId FROM watches WHERE productId > ? ORDER BY productId LIMIT ?",
+            (product_id, limit)
+        )]
+
+    def for_products(self, product_ids):
+        """{productId: [Watch, ...]} for every watch on product_ids"""
+        found = defaultdict(list)
+        for row in select_in(self.db, "SELECT watchId, userId, channelId, productId, subType, threshold, triggered "
+                                      "FROM watches WHERE productId IN ({ids})", product_ids):
+            found[row[3]].append(Watch(*row))
+        return found
+
+    def set_triggered(self, watch_ids, triggered):
+        if not watch_ids:
+            return
+        with self.db:
+            self.db.executemany("UPDATE watches SET triggered = ? WHERE watchId = ?",
+                                ((triggered, watch_id) for watch_id in watch_ids))
+
+    def stats(self):
+        watches, products, users = self.db.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT productId), COUNT(DISTINCT userId) FROM watches"
+        ).fetchone()
+        return {"watches": watches, "products": products, "users": users}
+
+
+def evaluate(watches, prices):
+    """Alerts for the watches whose price is at or below their threshold, and the triggered ones to rearm"""
+    alerts, rearm = [], []
+    for product_id, product_watches in watches.items():
+        markets = {price.sub_type_name: price.market for price in prices.get(product_id, ())
+                   if price.market is not None}
+        if not markets:
+            continue
+        cheapest = min(markets, key=markets.get)
+
+        for watch in product_watches:
+            sub_type = cheapest if watch.sub_type is None else watch.sub_type
+            price = markets.get(sub_type)
+            if price is None:
+                continue
+            if price <= watch.threshold:
+                if not watch.triggered:
+                    alerts.append(Alert(watch, sub_type, price))
+            elif watch.triggered:
+                rearm.append(watch.watch_id)
+    return alerts, rearm
+
+
+class Watchlist:
+    """Checks every watch against current prices from one task on a timer wheel.
+
+    A cycle prices the watched products, deduplicated across users, with
+    sample() making one call per `chunk_size` ids and at most `max_calls`
+    calls. Past that, the next cycle carries on from the last product, so
+    any number of watches costs a bounded number of calls per cycle. A
+    watch alerts once when the price drops to its threshold and rearms when
+    it goes back above; notify(user_id, channel_id, alerts) gets each
+    destination's alerts together."""
+
+    def __init__(self, store, sample, notify, interval=10 * 60, chunk_size=250, max_calls=20,
+                 wheel=None, metrics=None, claim=None):
+        self.store = store
+        self.sample = sample
+        self.notify = notify
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.max_calls = max_calls
+        self.wheel = TimerWheel() if wheel is None else wheel
+        self.metrics = metrics
+        self.claim = claim
+
+        self.timer = None
+        self.cursor = 0
+        self.last = {}
+
+    def start(self):
+        if self.timer is None:
+            self.timer = self.wheel.schedule(self.interval, self._cycle)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    async def _cycle(self):
+        try:
+            if self.claim is None or self.claim(self.interval / 2):
+                await self.check()
+        except Exception:
+            print_exc()
+        finally:
+            if self.timer is not None:
+                self.timer = self.wheel.schedule(self.interval, self._cycle)
+
+    async def check(self):
+        """Run one cycle, returning the alerts it sent"""
+        start = perf_counter()
+        limit = self.chunk_size * self.max_calls
+        ids = self.store.products_after(self.cursor, limit)
+        self.cursor = ids[-1] if len(ids) == limit else 0
+        if not ids:
+            return []
+
+        with timer(self.metrics, "watchlist", stage="price"):
+            prices = await self.sample(ids)
+        with timer(self.metrics, "watchlist", stage="evaluate"):
+            watches = self.store.for_products(ids)
+            alerts, rearm = evaluate(watches, prices)
+            self.store.set_triggered([alert.watch.watch_id for alert in alerts], True)
+            self.store.set_triggered(rearm, False)
+
+        destinations = defaultdict(list)
+        for alert in alerts:
+            destinations[alert.watch.user_id, alert.watch.channel_id].append(alert)
+        with timer(self.metrics, "watchlist", stage="notify"):
+            for (user_id, channel_id), user_alerts in destinations.items():
+                try:
+                    await self.notify(user_id, channel_id, user_alerts)
+                except Exception:
+                    print_exc()
+
+        elapsed = perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.observe("watchlist", elapsed, stage="cycle")
+            self.metrics.inc("watch_alerts", len(alerts))
+        self.last = {"products": len(ids), "watches": sum(map(len, watches.values())),
+                     "calls": -(-len(ids) // self.chunk_size), "alerts": len(alerts), "seconds": elapsed}
+        return alerts
+
+    def stats(self):
+        return {"store": self.store.stats(), "last_cycle": self.last}